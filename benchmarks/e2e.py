@@ -0,0 +1,208 @@
+import json
+import os
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import FixtureSearch, HashingEmbeddings, PageServer
+from gaia_multiagent.api_interaction import Task
+from gaia_multiagent.cfg import CacheCfg, RunnerCfg, SearchAssistantCfg, TracingCfg
+from gaia_multiagent.embeddings import EmbeddingService, set_embedding_service
+from gaia_multiagent.engines import GeminiEngine, GeminiVerifier
+from gaia_multiagent.results import get_result_store
+from gaia_multiagent.tracing import hot_spots, record
+from gaia_multiagent.utils import CachedPageVisit, InternetSearch, PlaywrightPageVisit
+from run import run_all, solve_task
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "benchmarks", "fixtures", "html")
+# Question, expected answer and the fixture page holding it.
+TASKS = [("How deep is the Challenger Deep in metres?", "10935", "news_article.html"),
+         ("How many Grammy Awards for Best Folk Album did Mercedes Sosa win?", "3", "wiki_article.html"),
+         ("What is the default timeout in the tool configuration reference?", "60", "docs_page.html"),
+         ("In which year is the oldest surviving bridge of the county first recorded?", "1394", "forum_thread.html")]
+PAGES = [{"title": "Scientists map the deepest trench - Daily Science", "page": "news_article.html",
+          "snippet": "The Challenger Deep in the Mariana Trench is the deepest point of the seafloor, in metres."},
+         {"title": "Mercedes Sosa - Encyclopedia", "page": "wiki_article.html",
+          "snippet": "Mercedes Sosa, Argentine singer, won the Grammy Award for Best Folk Album."},
+         {"title": "Configuration reference - Tool Docs", "page": "docs_page.html",
+          "snippet": "Configuration reference of the tool: options, default timeout and retries."},
+         {"title": "Oldest surviving bridge in the county? - Local History Forum", "page": "forum_thread.html",
+          "snippet": "Forum thread on the oldest surviving bridge in the county and the year it is first recorded."}]
+
+
+def code_step(thought: str, code: str) -> str:
+    return f"Thought: {thought}\n```py\n{code}\n```<end_code>"
+
+
+class ScriptedEngine(GeminiEngine):
+    # Plays every agent of the pipeline in place of Gemini, everything around the call (message conversion, response
+    # cache, tracing, code execution) is the real code.
+    def __init__(self, model_id: str = "scripted", answers: dict[str, str] | None = None, latency: float = 0.):
+        super().__init__(model_id=model_id)
+        self.answers = answers if answers is not None else {}
+        self.latency = latency
+
+    def script(self, system: str, contents: list[dict], stop_sequences: list[str]) -> str:
+        texts = [c["parts"][0]["text"] for c in contents]
+        if len(texts) == 0 or "<end_plan>" in stop_sequences:
+            return "1. Search the web for the question.\n2. Read the most relevant page.\n3. Answer.\n<end_plan>"
+        # Plans are also model messages, only the code actions count as steps.
+        step = sum(c["role"] == "model" and "```py" in t for c, t in zip(contents, texts))
+        conversation = "\n".join(texts)
+        urls = list(dict.fromkeys(re.findall(r"https?://[^\s)\]'\"\\]+", conversation)))
+        if "WebSearchAssistant" in system:
+            if step == 0:
+                return code_step("I search the web.", f"print(WebSearchAssistant(assignment={texts[0][-300:]!r}))")
+            answer = next((a for q, a in self.answers.items() if q in conversation), "unknown")
+            return code_step("I found the answer.", f"final_answer({answer!r})")
+        if "WebPageRetriever" in system:
+            if step == 0:
+                return code_step("I search the web.", f"print(WebSearch(query={texts[0][-200:]!r}))")
+            if step == 1 and len(urls) > 0:
+                return code_step("I read the best page.",
+                                 f"print(WebPageRetriever(task={texts[0][-200:]!r}, url={urls[0]!r}))")
+            return code_step("I summarize.", f"final_answer({conversation[-1000:]!r})")
+        if "WebSearchRAG" in system:
+            if step == 0:
+                return code_step("I query the index.", f"print(WebSearchRAG(query={texts[0][-200:]!r}))")
+            return code_step("I summarize.", f"final_answer({('Sources: ' + ' '.join(urls))!r})")
+        # Page reading and map-reduce calls only need plain text.
+        return "Summary: " + texts[-1][-500:]
+
+    def _generate(self, system: str, contents: list[dict], stop_sequences: list[str]) -> str:
+        time.sleep(self.latency)
+        out = self.script(system, contents, stop_sequences)
+        prompt_chars = len(system) + sum(len(c["parts"][0]["text"]) for c in contents)
+        record(api_calls=1, input_tokens=prompt_chars // 4, output_tokens=len(out) // 4)
+        return out
+
+
+class ScriptedVerifier(GeminiVerifier):
+    def __init__(self, model_id: str = "scripted-verifier", latency: float = 0.):
+        super().__init__(model_id=model_id)
+        self.latency = latency
+
+    def _generate(self, prompt: str) -> str:
+        time.sleep(self.latency)
+        record(api_calls=1, input_tokens=len(prompt) // 4, output_tokens=2)
+        return "[CORRECT]"
+
+
+# Set by the child process before the run, read by the workers (threads or forked processes).
+_setup: dict = {}
+
+
+def solve_offline(task: Task, results_path: str, timeout: float | None = None) -> tuple[str, list]:
+    visit_tool = CachedPageVisit(PlaywrightPageVisit()) if _setup["fetch"] == "browser" else None
+    search_engine = InternetSearch(search_tool=FixtureSearch(_setup["pages"], latency=_setup["search_latency"]),
+                                   visit_tool=visit_tool)
+    return solve_task(task, results_path, timeout,
+                      engine=ScriptedEngine(answers=_setup["answers"], latency=_setup["llm_latency"]),
+                      verifier=ScriptedVerifier(latency=_setup["llm_latency"]),
+                      search_engine=search_engine)
+
+
+def run_child(args) -> dict:
+    folder = tempfile.mkdtemp()
+    try:
+        with PageServer(FIXTURES) as server:
+            _setup.update(fetch=args.fetch,
+                          llm_latency=args.llm_latency,
+                          search_latency=args.search_latency,
+                          answers={q: a for q, a, _ in TASKS},
+                          pages=[{**p, "url": f"{server.url}/{p['page']}"} for p in PAGES])
+            if args.fake_embeddings:
+                set_embedding_service(EmbeddingService(SearchAssistantCfg.embedding_model, model=HashingEmbeddings()))
+            tasks = [Task(description=TASKS[i % len(TASKS)][0], task_id=f"e2e{i}", filepath=None)
+                     for i in range(args.tasks)]
+            results_path = os.path.join(folder, "results.sqlite")
+            trace_dir = os.path.join(folder, "traces")
+            cfg = RunnerCfg(workers=args.workers,
+                            executor=args.executor,
+                            cache_cfg=CacheCfg(cache_dir=os.path.join(folder, "cache")),
+                            tracing_cfg=TracingCfg(trace_dir=trace_dir))
+            start = time.perf_counter()
+            run_all(results_path, cfg=cfg, tasks=tasks, solver=solve_offline)
+            elapsed = time.perf_counter() - start
+        store = get_result_store(results_path)
+        correct = sum(store.answer(t.task_id) == TASKS[i % len(TASKS)][1] for i, t in enumerate(tasks))
+        usage = [resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)]
+        return {"workers": args.workers,
+                "tasks": args.tasks,
+                "correct": correct,
+                "seconds": elapsed,
+                "tasks_per_second": args.tasks / elapsed,
+                # ru_maxrss is in KiB on Linux.
+                "peak_rss_mb": max(u.ru_maxrss for u in usage) / 1024,
+                "stages": dict(hot_spots(trace_dir, [t.task_id for t in tasks])[:15])}
+    finally:
+        shutil.rmtree(folder)
+
+
+def run_in_subprocess(args, workers: int) -> dict:
+    # A fresh interpreter per configuration, so that peak memory and warm caches don't carry over.
+    with tempfile.NamedTemporaryFile(suffix=".json") as out:
+        command = [sys.executable, os.path.abspath(__file__), "--child", out.name,
+                   "--workers", str(workers),
+                   "--tasks", str(args.tasks),
+                   "--executor", args.executor,
+                   "--fetch", args.fetch,
+                   "--llm_latency", str(args.llm_latency),
+                   "--search_latency", str(args.search_latency)]
+        if args.fake_embeddings:
+            command.append("--fake_embeddings")
+        subprocess.run(command, cwd=ROOT, check=True, stdout=None if args.verbose else subprocess.DEVNULL)
+        with open(out.name) as f:
+            return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=12)
+    parser.add_argument("--workers", type=int, nargs="*", default=[1, 4])
+    parser.add_argument("--executor", type=str, choices=["thread", "process"], default="thread")
+    parser.add_argument("--fetch", type=str, choices=["tiered", "browser"], default="tiered",
+                        help="Fetch the local pages with the default tiers or always with the headless browser.")
+    parser.add_argument("--llm_latency", type=float, default=0.5, help="Seconds each scripted Gemini call takes.")
+    parser.add_argument("--search_latency", type=float, default=0.3)
+    parser.add_argument("--fake_embeddings", action="store_true",
+                        help="Hash words instead of loading the embedding model, to run without any download.")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the agents.")
+    parser.add_argument("--child", type=str, default=None, help="Internal, runs one configuration and writes it here.")
+    parser.add_argument("--output", type=str, default=os.path.join(ROOT, "benchmarks", "results", "e2e.json"))
+    parser.add_argument("--baseline", type=str, default=None,
+                        help="Previous output to compare with, the script fails if the throughput dropped.")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    if args.child is not None:
+        args.workers = args.workers[0]
+        result = run_child(args)
+        with open(args.child, "w") as f:
+            json.dump(result, f)
+        sys.exit(0)
+    results = {str(workers): run_in_subprocess(args, workers) for workers in args.workers}
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    for workers, result in results.items():
+        print(f"{workers} workers: {result['seconds']:.1f}s, {result['tasks_per_second']:.2f} tasks/s, "
+              f"{result['correct']}/{result['tasks']} correct, peak RSS {result['peak_rss_mb']:.0f} MB")
+        for name, total in list(result["stages"].items())[:8]:
+            print(f"    {name}: {total['seconds']:.1f}s over {total['count']} spans")
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = [workers for workers in results if workers in baseline
+                       and results[workers]["tasks_per_second"]
+                       < (1 - args.tolerance) * baseline[workers]["tasks_per_second"]]
+        if len(regressions) > 0:
+            print("Throughput regressions (workers): ", regressions)
+            sys.exit(1)
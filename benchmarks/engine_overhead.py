@@ -0,0 +1,80 @@
+import copy
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gaia_multiagent.engines import GeminiEngine
+
+
+class _Response:
+    text = "Thought: done\nCode:\n```py\nfinal_answer('42')\n```"
+
+
+class _Models:
+    def generate_content(self, model, contents, config):
+        return _Response()
+
+
+class _Chat:
+    def send_message(self, message, config):
+        return _Response()
+
+
+class _Chats:
+    def create(self, model, history):
+        return _Chat()
+
+
+class FakeClient:
+    # Answers instantly so the timings only contain the client-side overhead.
+    models = _Models()
+    chats = _Chats()
+
+
+def agent_history(steps: int, observation_chars: int) -> list[list[dict]]:
+    messages = [{"role": "system", "content": [{"type": "text", "text": "You are an agent. " * 500}]},
+                {"role": "user", "content": [{"type": "text", "text": "New task: find the answer."}]}]
+    histories = []
+    for step in range(steps):
+        messages = messages + [
+            {"role": "assistant", "content": [{"type": "text", "text": f"Thought: step {step}\n" * 20}]},
+            {"role": "tool-response",
+             "content": [{"type": "text", "text": f"Observation {step}: " + "x" * observation_chars}]}]
+        # smolagents rebuilds the message dicts at every step.
+        histories.append(copy.deepcopy(messages))
+    return histories
+
+
+def legacy_generate(engine: GeminiEngine, messages: list[dict]) -> str:
+    # The previous request path: defensive deep copies and a chat session per call.
+    messages = copy.deepcopy(messages)
+    history = [engine.format_role(copy.deepcopy(message)) for message in messages[1:-1]]
+    chat = engine.client.chats.create(model=engine.model_id, history=history)
+    return chat.send_message(messages[-1]["content"][0]["text"], config=None).text
+
+
+def time_calls(call, histories: list[list[dict]], repeats: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for messages in histories:
+            call(messages)
+    return (time.perf_counter() - start) / (repeats * len(histories))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--steps", type=int, default=15)
+    parser.add_argument("--observation_chars", type=int, default=20_000)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+    histories = agent_history(steps=args.steps, observation_chars=args.observation_chars)
+    engine = GeminiEngine(model_id="fake")
+    engine.client = FakeClient()
+    legacy = time_calls(lambda m: legacy_generate(engine, m), histories, args.repeats)
+    current = time_calls(lambda m: engine.generate(m), histories, args.repeats)
+    print(f"Per-call overhead over a {args.steps}-step run, network excluded:")
+    print(f"    legacy: {legacy * 1e6:.0f} us")
+    print(f"    current: {current * 1e6:.0f} us")
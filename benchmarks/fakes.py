@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class LocalServer:
+    # Serves a handler class on a free local port from a background thread.
+    def __init__(self, handler: type[BaseHTTPRequestHandler]):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self) -> "LocalServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeScoringAPI(LocalServer):
+    # Stand-in for the course scoring API: /questions with ETag support and /files/<task_id> with Range support.
+    def __init__(self, questions: list[dict], files: dict[str, bytes]):
+        self.questions = questions
+        self.files = files
+        self.requests: list[tuple[str, int, int]] = []
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args) -> None:
+                pass
+
+            def send(self, status: int, body: bytes = b"", headers: dict | None = None) -> None:
+                self.send_response(status)
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                api.requests.append((self.path, status, len(body)))
+
+            def do_GET(self) -> None:
+                if self.path == "/questions":
+                    body = json.dumps(api.questions).encode()
+                    etag = '"' + hashlib.sha256(body).hexdigest() + '"'
+                    if self.headers.get("If-None-Match") == etag:
+                        self.send(304)
+                    else:
+                        self.send(200, body, {"ETag": etag, "Content-Type": "application/json"})
+                elif self.path.startswith("/files/") and self.path[len("/files/"):] in api.files:
+                    content = api.files[self.path[len("/files/"):]]
+                    byte_range = self.headers.get("Range")
+                    if byte_range is None:
+                        self.send(200, content)
+                        return
+                    start = int(byte_range.removeprefix("bytes=").split("-")[0])
+                    if start >= len(content):
+                        self.send(416, headers={"Content-Range": f"bytes */{len(content)}"})
+                    else:
+                        content_range = f"bytes {start}-{len(content) - 1}/{len(content)}"
+                        self.send(206, content[start:], {"Content-Range": content_range})
+                else:
+                    self.send(404)
+
+        super().__init__(Handler)
+
+    def downloaded_bytes(self) -> int:
+        return sum(size for _, _, size in self.requests)
+
+
+class PageServer(LocalServer):
+    # Serves the saved HTML pages of a folder, as a website would.
+    def __init__(self, folder: str):
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                path = os.path.join(folder, os.path.basename(self.path))
+                if not os.path.isfile(path):
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                with open(path, "rb") as f:
+                    body = f.read()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        super().__init__(Handler)
+
+
+class FixtureSearch:
+    # Stand-in for DuckDuckGoSearchTool, returns the fixture pages ranked by word overlap with the query.
+    def __init__(self, pages: list[dict[str, str]], max_results: int = 5, latency: float = 0.):
+        self.pages = pages
+        self.max_results = max_results
+        self.latency = latency
+
+    def __call__(self, query: str) -> str:
+        time.sleep(self.latency)
+        words = set(re.findall(r"\w+", query.lower()))
+        ranked = sorted(self.pages, key=lambda p: -len(words & set(re.findall(r"\w+", p["snippet"].lower()))))
+        results = [f"[{p['title']}]({p['url']})\n{p['snippet']}" for p in ranked[:self.max_results]]
+        return "## Search Results\n\n" + "\n\n".join(results)
+
+
+class HashingEmbeddings(Embeddings):
+    # Deterministic bag-of-words vectors, so that retrieval runs without downloading an embedding model.
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            vector[int(hashlib.md5(word.encode()).hexdigest()[:8], 16) % self.dim] += 1.
+        return (vector / (np.linalg.norm(vector) + 1e-12)).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
@@ -0,0 +1,67 @@
+import os
+import random
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gaia_multiagent.cfg import HedgeCfg
+from gaia_multiagent.hedging import Cancellation, Hedger
+
+
+class SlowEndpoint:
+    # Log-normal latencies around the median, with a fraction of stragglers ten times slower.
+    def __init__(self, median: float, straggler_rate: float, seed: int = 0):
+        self.median = median
+        self.straggler_rate = straggler_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, cancellation: Cancellation) -> str:
+        with self._lock:
+            self.requests += 1
+            latency = self.median * self.random.lognormvariate(0, 0.25)
+            if self.random.random() < self.straggler_rate:
+                latency *= 10
+        done = threading.Event()
+        cancellation.add_callback(done.set)
+        if done.wait(latency):
+            raise RuntimeError("cancelled")
+        return "ok"
+
+
+def run(cfg: HedgeCfg, calls: int, workers: int, median: float, straggler_rate: float) -> dict:
+    hedger = Hedger(cfg)
+    endpoint = SlowEndpoint(median, straggler_rate)
+
+    def timed_call(_) -> float:
+        start = time.perf_counter()
+        hedger.call("endpoint", endpoint)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        latencies = sorted(executor.map(timed_call, range(calls)))
+    hedger.shutdown()
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+    return {"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99), "max": latencies[-1],
+            "extra_requests": endpoint.requests / calls - 1}
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--median", type=float, default=0.02, help="Median latency of the simulated endpoint.")
+    parser.add_argument("--straggler_rate", type=float, default=0.03)
+    args = parser.parse_args()
+    print(f"{'':>16} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'extra requests':>15}")
+    for name, cfg in [("no hedging", HedgeCfg()),
+                      ("hedged at p95", HedgeCfg(enabled=True, percentile=0.95)),
+                      ("hedged at p90", HedgeCfg(enabled=True, percentile=0.9, max_extra_fraction=0.1))]:
+        result = run(cfg, args.calls, args.workers, args.median, args.straggler_rate)
+        print(f"{name:>16} {result['p50'] * 1000:>8.1f} {result['p95'] * 1000:>8.1f} {result['p99'] * 1000:>8.1f} "
+              f"{result['max'] * 1000:>8.1f} {result['extra_requests']:>15.1%}")
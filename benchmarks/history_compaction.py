@@ -0,0 +1,56 @@
+import os
+import random
+import sys
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.engine_overhead import FakeClient
+from gaia_multiagent.cfg import CompactionCfg
+from gaia_multiagent.engines import GeminiEngine
+from gaia_multiagent.tracing import span
+
+
+def message(role: str, text: str) -> dict:
+    return {"role": role, "content": [{"type": "text", "text": text}]}
+
+
+def agent_run(steps: int, seed: int = 0) -> list[list[dict]]:
+    # A manager run: long system prompt, a task with an inlined file, and observations from search summaries and
+    # page extracts of a few thousand characters each.
+    rng = random.Random(seed)
+    words = ["album", "singer", "released", "award", "record", "year", "folk", "Argentina", "studio", "live"]
+    messages = [message("system", "You are an expert assistant who can solve any task using code blobs. " * 150),
+                message("user", "New task: How many studio albums were released? File content:\n" + "a,b,c\n" * 300)]
+    histories = []
+    for step in range(steps):
+        observation = " ".join(rng.choice(words) for _ in range(rng.choice([300, 800, 2000])))
+        # Each step sends the model output, the tool call and its response, as smolagents' ActionStep does.
+        code = f"print(WebSearchAssistant(assignment='part {step}'))"
+        messages = messages + [message("assistant", f"Thought: step {step}.\n```py\n{code}\n```"),
+                               message("tool-call", f"Calling tools:\n[{{'id': 'call_{step}', 'type': 'function', "
+                                                    f"'function': {{'name': 'python_interpreter', "
+                                                    f"'arguments': {code!r}}}}}]"),
+                               message("tool-response", f"Observation:\nExecution logs:\n{observation}")]
+        histories.append(messages)
+    return histories
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--steps", type=int, default=15)
+    parser.add_argument("--token_budget", type=int, default=CompactionCfg.token_budget)
+    args = parser.parse_args()
+    engine = GeminiEngine(model_id="fake", compaction_cfg=CompactionCfg(enabled=True, token_budget=args.token_budget))
+    engine.client = FakeClient()
+    print(f"{'step':>5} {'full tokens':>12} {'compacted tokens':>17}")
+    total_full = total_sent = 0
+    for step, messages in enumerate(agent_run(args.steps)):
+        with span("step") as root:
+            engine.generate(messages)
+        counters = root.summary()["gemini.generate"]
+        total_full += counters["uncompacted_prompt_tokens"]
+        total_sent += counters["prompt_tokens"]
+        print(f"{step + 1:>5} {counters['uncompacted_prompt_tokens']:>12} {counters['prompt_tokens']:>17}")
+    print(f"Prompt tokens over the run: {total_full} without compaction, {total_sent} with it "
+          f"({1 - total_sent / total_full:.0%} saved).")
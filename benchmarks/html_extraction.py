@@ -0,0 +1,78 @@
+import copy
+import glob
+import json
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bs4 import BeautifulSoup
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from markdownify import markdownify
+
+from gaia_multiagent.cfg import ExtractCfg, RetrieverCfg
+from gaia_multiagent.extraction import content_root, html_to_markdown
+
+
+def best_time(convert, html: str, repeats: int) -> tuple[str, float]:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        out = convert(html)
+        timings.append(time.perf_counter() - start)
+    return out, min(timings)
+
+
+def scale_content(html: str, scale: int) -> str:
+    # Repeats the main content of the page, the site chrome around it stays the same as in a real long page.
+    soup = BeautifulSoup(html, "html.parser")
+    root = content_root(soup)
+    content = list(root.contents)
+    for _ in range(scale - 1):
+        root.extend([copy.copy(c) for c in content])
+    return str(soup)
+
+
+def measure(html: str, splitter: RecursiveCharacterTextSplitter, repeats: int) -> dict:
+    converters = {"markdownify": markdownify,
+                  "extracted": html_to_markdown,
+                  "extracted_fast": lambda h: html_to_markdown(h, cfg=ExtractCfg(fast_path_chars=0))}
+    results = {}
+    for name, convert in converters.items():
+        out, seconds = best_time(convert, html, repeats)
+        chunks = splitter.split_text(out)
+        # Embeddings are cached by chunk hash, so only distinct chunks cost an embedding.
+        results[name] = {"ms": seconds * 1000, "chars": len(out), "chunks": len(chunks), "embeddings": len(set(chunks))}
+    return results
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--fixtures", type=str, default=os.path.join(ROOT, "benchmarks", "fixtures", "html"),
+                        help="Folder of saved HTML pages.")
+    parser.add_argument("--scale", type=int, default=200,
+                        help="Also measure each page with its body repeated this many times, as a large document.")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", type=str, default=os.path.join(ROOT, "benchmarks", "results", "html_extraction.json"))
+    args = parser.parse_args()
+    cfg = RetrieverCfg()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=cfg.chunk_size, chunk_overlap=cfg.chunk_overlap,
+                                              separators=cfg.separators)
+    results = {}
+    for path in sorted(glob.glob(os.path.join(args.fixtures, "*.html"))):
+        with open(path) as f:
+            html = f.read()
+        name = os.path.splitext(os.path.basename(path))[0]
+        results[name] = measure(html, splitter, args.repeats)
+        if args.scale > 1:
+            results[f"{name}_x{args.scale}"] = measure(scale_content(html, args.scale), splitter, 1)
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"{'page':<24} {'converter':<15} {'ms':>9} {'chars':>10} {'chunks':>7} {'embeddings':>11}")
+    for name, by_converter in results.items():
+        for converter, r in by_converter.items():
+            print(f"{name:<24} {converter:<15} {r['ms']:>9.1f} {r['chars']:>10} {r['chunks']:>7} {r['embeddings']:>11}")
@@ -0,0 +1,55 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from argparse import ArgumentParser
+
+ENTRY_POINTS = ["gaia_multiagent.pipeline", "run"]
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(module: str) -> dict[str, int]:
+    # -X importtime reports the cumulative microseconds spent importing every module on stderr.
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+\s+\|\s+(\d+)\s+\|(\s+)(\S+)", line)
+        if match is not None:
+            times[match.group(3)] = int(match.group(1))
+    return times
+
+
+def measure(module: str, repeats: int) -> dict:
+    runs = [import_times(module) for _ in range(repeats)]
+    total = sorted(r[module] for r in runs)[repeats // 2]
+    heaviest = sorted(runs[0].items(), key=lambda item: item[1], reverse=True)
+    top_level = [(name, us) for name, us in heaviest if "." not in name and name != module][:10]
+    return {"total_ms": total / 1000, "heaviest": {name: us / 1000 for name, us in top_level}}
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", type=str, default=os.path.join(ROOT, "benchmarks", "results", "startup.json"))
+    parser.add_argument("--baseline", type=str, default=None,
+                        help="Previous output to compare with, the script fails if an entry point got slower.")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    results = {module: measure(module, args.repeats) for module in ENTRY_POINTS}
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    for module, result in results.items():
+        print(f"{module}: {result['total_ms']:.0f} ms")
+        for name, ms in result["heaviest"].items():
+            print(f"    {name}: {ms:.0f} ms")
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = [module for module in results if module in baseline
+                       and results[module]["total_ms"] > (1 + args.tolerance) * baseline[module]["total_ms"]]
+        if len(regressions) > 0:
+            print("Import time regressions: ", regressions)
+            sys.exit(1)
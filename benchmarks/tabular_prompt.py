@@ -0,0 +1,48 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from gaia_multiagent.cache import configure_caches
+from gaia_multiagent.cfg import CacheCfg, TabularCfg
+from gaia_multiagent.utils import load_as_txt
+
+
+def make_table(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({"id": np.arange(n_rows),
+                         "city": rng.choice(["Rome", "Paris", "Berlin", "Madrid"], size=n_rows),
+                         "category": rng.choice(["food", "drinks", "other"], size=n_rows),
+                         "price": rng.uniform(1, 100, size=n_rows).round(2),
+                         "quantity": rng.integers(1, 20, size=n_rows),
+                         "date": pd.date_range("2024-01-01", periods=n_rows, freq="h")})
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="*", default=[100, 1_000, 10_000, 100_000])
+    parser.add_argument("--steps", type=int, default=15, help="Manager steps, the prompt is sent again at each one.")
+    args = parser.parse_args()
+    folder = tempfile.mkdtemp()
+    configure_caches(CacheCfg(cache_dir=folder))
+    inline_cfg = TabularCfg(inline_max_cells=sys.maxsize)
+    try:
+        print(f"{'rows':>8} {'inline tokens':>14} {'query tokens':>13} {'saved per run':>14} {'cached load ms':>15}")
+        for n_rows in args.rows:
+            filepath = os.path.join(folder, f"table_{n_rows}.csv")
+            make_table(n_rows).to_csv(filepath, index=False)
+            # Prompt tokens estimated at 4 characters per token, as the rate limiter does.
+            inline = len(load_as_txt(filepath, cfg=inline_cfg)) // 4
+            start = time.perf_counter()
+            query = len(load_as_txt(filepath)) // 4
+            elapsed = time.perf_counter() - start
+            print(f"{n_rows:>8} {inline:>14} {query:>13} {(inline - query) * args.steps:>14} {elapsed * 1000:>15.1f}")
+    finally:
+        shutil.rmtree(folder)
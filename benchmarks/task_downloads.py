@@ -0,0 +1,52 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import FakeScoringAPI
+from gaia_multiagent.api_interaction import fetch_tasks
+
+
+def make_api(n_tasks: int, file_size: int) -> FakeScoringAPI:
+    questions = [{"task_id": f"task{i}", "question": f"Question {i}?", "file_name": f"file{i}.txt" if i % 2 else ""}
+                 for i in range(n_tasks)]
+    files = {q["task_id"]: os.urandom(file_size) for q in questions if q["file_name"]}
+    return FakeScoringAPI(questions=questions, files=files)
+
+
+def timed_fetch(api: FakeScoringAPI, folder: str) -> tuple[float, int]:
+    api.requests.clear()
+    start = time.perf_counter()
+    tasks = fetch_tasks(files_folder=folder, api_url=api.url)
+    elapsed = time.perf_counter() - start
+    for t in tasks:
+        if t.filepath is not None:
+            with open(t.filepath, "rb") as f:
+                assert f.read() == api.files[t.task_id], f"Wrong content for {t.filepath}"
+    return elapsed, api.downloaded_bytes()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=40)
+    parser.add_argument("--file_size", type=int, default=1024 ** 2)
+    args = parser.parse_args()
+    folder = tempfile.mkdtemp()
+    try:
+        with make_api(args.tasks, args.file_size) as api:
+            cold = timed_fetch(api, folder)
+            warm = timed_fetch(api, folder)
+            # Simulates a download interrupted half way through.
+            partial = os.path.join(folder, "file1.txt")
+            os.replace(partial, partial + ".part")
+            with open(partial + ".part", "r+b") as f:
+                f.truncate(args.file_size // 2)
+            resumed = timed_fetch(api, folder)
+        for name, (elapsed, downloaded) in [("cold", cold), ("warm", warm), ("resumed", resumed)]:
+            print(f"{name}: {elapsed * 1000:.0f} ms, {downloaded / 1024:.0f} KiB downloaded")
+    finally:
+        shutil.rmtree(folder)
@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gaia_multiagent.verification import compact_trace, format_issues, normalize_answer
+
+QUESTION = "Find the answer to the following question: How many studio albums did Mercedes Sosa publish in 2000-2009?"
+ANSWERS = ["3", "three", "3.", "Final answer: 3", "1,000", "a,b ,c", "3 albums", "'Paris'", "U.S."]
+
+
+def succinct_steps(n_steps: int, observation_chars: int) -> list[dict]:
+    # Same fields as smolagents' get_succinct_steps, with a web search assistant report as the observation.
+    steps = [{"task": QUESTION}]
+    for i in range(n_steps):
+        code = f"info = WebSearchAssistant(assignment='Albums of Mercedes Sosa, part {i}')\nprint(info)"
+        steps.append({"step_number": i + 1,
+                      "timing": {"start_time": 1.7e9 + i, "end_time": 1.7e9 + i + 12.3, "duration": 12.3},
+                      "token_usage": {"input_tokens": 5000 + 1000 * i, "output_tokens": 120},
+                      "model_output": f"Thought: I look for part {i}.\n```py\n{code}\n```",
+                      "tool_calls": [{"id": f"call_{i}", "type": "function",
+                                      "function": {"name": "python_interpreter", "arguments": code}}],
+                      "observations": "Execution logs:\n" + ("Mercedes Sosa released Corazón libre in 2005. "
+                                                             * (observation_chars // 46)),
+                      "error": None,
+                      "action_output": None,
+                      "is_final_answer": False})
+    return steps
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--steps", type=int, nargs="*", default=[2, 5, 10, 15])
+    parser.add_argument("--observation_chars", type=int, default=8_000)
+    args = parser.parse_args()
+    # Prompt tokens estimated at 4 characters per token, as the rate limiter does.
+    print(f"{'steps':>6} {'full trace tokens':>18} {'compact tokens':>15} {'compact ms':>11}")
+    for n_steps in args.steps:
+        steps = succinct_steps(n_steps, args.observation_chars)
+        full = len(str(steps[1:])) // 4
+        start = time.perf_counter()
+        compact = len(compact_trace(steps[1:])) // 4
+        elapsed = time.perf_counter() - start
+        print(f"{n_steps:>6} {full:>18} {compact:>15} {elapsed * 1000:>11.2f}")
+    print("\nLocal format checks:")
+    for answer in ANSWERS:
+        start = time.perf_counter()
+        normalized = normalize_answer(answer)
+        issues = format_issues(QUESTION, normalized)
+        elapsed = time.perf_counter() - start
+        verdict = "rejected: " + "; ".join(issues) if len(issues) > 0 else "sent to the verifier"
+        print(f"    {answer!r} -> {normalized!r}, {verdict} ({elapsed * 1e6:.0f} us)")
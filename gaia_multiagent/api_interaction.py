@@ -1,9 +1,19 @@
+import json
 import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from enum import StrEnum
 from typing import Self
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from gaia_multiagent.cache import file_hash
+
+API_URL = "https://agents-course-unit4-scoring.hf.space"
 
 
 class TaskType(StrEnum):
@@ -43,23 +53,120 @@ class Task:
         return TaskType.from_str(self.filepath)
 
 
-def fetch_tasks(files_folder: str = "tmp_files", chunk_size: int = 8192) -> list[Task]:
-    response = requests.get("https://agents-course-unit4-scoring.hf.space/questions")
+def make_session(pool_size: int = 8, retries: int = 3) -> requests.Session:
+    session = requests.Session()
+    retries = Retry(total=retries, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch_questions(session: requests.Session, api_url: str, cache_path: str, timeout: float) -> list[dict]:
+    # Conditional request: the cached questions are reused when the server answers 304 Not Modified.
+    cached = None
+    headers = {}
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            cached = json.load(f)
+        if cached.get("etag") is not None:
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified") is not None:
+            headers["If-Modified-Since"] = cached["last_modified"]
+    response = session.get(f"{api_url}/questions", headers=headers, timeout=timeout)
+    if response.status_code == 304 and cached is not None:
+        return cached["questions"]
     response.raise_for_status()
-    tasks_data = response.json()
-    os.makedirs(files_folder, exist_ok=True)
-    output = []
-    for t in tasks_data:
-        if len(fname := t["file_name"]) > 0:
-            filepath = os.path.join(files_folder, fname)
-            tid = t["task_id"]
-            url = f"https://agents-course-unit4-scoring.hf.space/files/{tid}"
-            fileresponse = requests.get(url, stream=True)
-            with open(filepath, 'wb') as f:
-                for chunk in fileresponse.iter_content(chunk_size=chunk_size):
+    questions = response.json()
+    write_json(cache_path, {"etag": response.headers.get("ETag"),
+                            "last_modified": response.headers.get("Last-Modified"),
+                            "questions": questions})
+    return questions
+
+
+def write_json(path: str, content: dict) -> None:
+    with open(path + ".tmp", "w") as f:
+        json.dump(content, f)
+    os.replace(path + ".tmp", path)
+
+
+def remote_size(response: requests.Response) -> int | None:
+    match = re.fullmatch(r"bytes (\d+-\d+|\*)/(\d+)", response.headers.get("Content-Range", "").strip())
+    if match is not None:
+        return int(match.group(2))
+    if response.status_code == 200 and "Content-Encoding" not in response.headers:
+        length = response.headers.get("Content-Length", None)
+        return int(length) if length is not None and length.isdigit() else None
+    return None
+
+
+def download_file(session: requests.Session, url: str, filepath: str, timeout: float, chunk_size: int) -> dict:
+    # Interrupted downloads are kept in a .part file and resumed with a Range request.
+    partial = filepath + ".part"
+    offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset > 0 else {}
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        expected = remote_size(response)
+        if response.status_code == 416 and offset > 0:
+            if expected != offset:
+                # The partial file doesn't match the remote one, it is downloaded again from the start.
+                os.remove(partial)
+                return download_file(session, url, filepath, timeout, chunk_size)
+        else:
+            response.raise_for_status()
+            if response.status_code != 206:
+                offset = 0
+            with open(partial, "ab" if offset > 0 else "wb") as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
                     if chunk:  # filter out keep-alive chunks
                         f.write(chunk)
-            output.append(Task(description=t['question'], task_id=tid, filepath=filepath))
-        else:
-            output.append(Task(description=t['question'], task_id=t['task_id'], filepath=None))
-    return output
\ No newline at end of file
+    size = os.path.getsize(partial)
+    if expected is not None and size != expected:
+        # Left in place, the next attempt resumes it.
+        raise IOError(f"Downloaded {size} bytes of {url}, expected {expected}.")
+    os.replace(partial, filepath)
+    return {"size": size, "sha256": file_hash(filepath)}
+
+
+def is_downloaded(filepath: str, entry: dict | None) -> bool:
+    return (entry is not None and os.path.exists(filepath) and os.path.getsize(filepath) == entry["size"]
+            and file_hash(filepath) == entry["sha256"])
+
+
+def fetch_tasks(files_folder: str = "tmp_files",
+                chunk_size: int = 8192,
+                api_url: str = API_URL,
+                max_workers: int = 8,
+                timeout: float = 30.) -> list[Task]:
+    os.makedirs(files_folder, exist_ok=True)
+    session = make_session(pool_size=max_workers)
+    tasks_data = fetch_questions(session, api_url, os.path.join(files_folder, "questions.json"), timeout)
+    manifest_path = os.path.join(files_folder, "manifest.json")
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    manifest_lock = threading.Lock()
+
+    def download(tid: str, fname: str) -> None:
+        filepath = os.path.join(files_folder, fname)
+        if is_downloaded(filepath, manifest.get(fname, None)):
+            return
+        entry = download_file(session, f"{api_url}/files/{tid}", filepath, timeout=timeout, chunk_size=chunk_size)
+        with manifest_lock:
+            manifest[fname] = entry
+            write_json(manifest_path, manifest)
+
+    output = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        downloads = []
+        for t in tasks_data:
+            if len(fname := t["file_name"]) > 0:
+                downloads.append(executor.submit(download, t["task_id"], fname))
+                output.append(Task(description=t['question'], task_id=t['task_id'],
+                                   filepath=os.path.join(files_folder, fname)))
+            else:
+                output.append(Task(description=t['question'], task_id=t['task_id'], filepath=None))
+        for d in downloads:
+            d.result()
+    return output
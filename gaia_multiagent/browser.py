@@ -0,0 +1,176 @@
+import asyncio
+import atexit
+import threading
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Literal
+
+from gaia_multiagent.cfg import BrowserCfg
+from gaia_multiagent.hedging import Cancellation
+
+if TYPE_CHECKING:
+    from playwright.async_api import Browser, BrowserContext, Page, Playwright
+
+WaitUntil = Literal["commit", "domcontentloaded", "load", "networkidle"] | None
+
+
+class BrowserCrashedError(RuntimeError):
+    pass
+
+
+class _Slot:
+    def __init__(self, context: "BrowserContext", page: "Page", generation: int):
+        self.context = context
+        self.page = page
+        self.generation = generation
+        self.navigations = 0
+
+
+class AsyncBrowserPool:
+    def __init__(self, cfg: BrowserCfg = BrowserCfg()):
+        self.cfg = cfg
+        self._playwright: "Playwright | None" = None
+        self._browser: "Browser | None" = None
+        self._generation = 0
+        self._idle: list[_Slot] = []
+        self._semaphore: asyncio.Semaphore | None = None
+        self._lock: asyncio.Lock | None = None
+
+    async def start(self) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+            self._semaphore = asyncio.Semaphore(self.cfg.max_pages)
+        async with self._lock:
+            if self._browser is not None and self._browser.is_connected():
+                return
+            if self._playwright is None:
+                from playwright.async_api import async_playwright
+                self._playwright = await async_playwright().start()
+            # Slots of a dead browser can't be reused, they are dropped when they come back to the pool.
+            self._idle.clear()
+            self._generation += 1
+            self._browser = await self._playwright.chromium.launch(headless=self.cfg.headless)
+
+    async def _new_slot(self) -> _Slot:
+        context = await self._browser.new_context()
+        page = await context.new_page()
+        return _Slot(context=context, page=page, generation=self._generation)
+
+    @staticmethod
+    async def _discard(slot: _Slot) -> None:
+        from playwright.async_api import Error as PlaywrightError
+        try:
+            await slot.context.close()
+        except PlaywrightError:
+            pass
+
+    @asynccontextmanager
+    async def page(self) -> AsyncIterator["Page"]:
+        await self.start()
+        async with self._semaphore:
+            slot = self._idle.pop() if self._idle else await self._new_slot()
+            healthy = False
+            try:
+                yield slot.page
+                healthy = True
+            finally:
+                slot.navigations += 1
+                if (healthy and slot.generation == self._generation and slot.navigations < self.cfg.recycle_after
+                        and not slot.page.is_closed()):
+                    self._idle.append(slot)
+                else:
+                    await self._discard(slot)
+
+    async def fetch(self, url: str, wait_until: WaitUntil = "load", timeout: float | None = None) -> str:
+        from playwright.async_api import Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
+        timeout = self.cfg.navigation_timeout if timeout is None else timeout
+        for attempt in range(2):
+            try:
+                async with self.page() as page:
+                    await page.goto(url, wait_until=wait_until, timeout=timeout * 1000)
+                    return await page.content()
+            except PlaywrightTimeoutError:
+                raise TimeoutError(f"Impossible to load the page {url}")
+            except PlaywrightError as e:
+                if self._browser is not None and self._browser.is_connected():
+                    raise
+                if attempt == 1:
+                    raise BrowserCrashedError(f"Browser crashed while loading {url}") from e
+                # The browser died under us, start() respawns it on the next attempt.
+
+    async def close(self) -> None:
+        from playwright.async_api import Error as PlaywrightError
+        for slot in self._idle:
+            await self._discard(slot)
+        self._idle.clear()
+        if self._browser is not None:
+            try:
+                await self._browser.close()
+            except PlaywrightError:
+                pass
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+
+class BrowserPool:
+    # Sync facade: the async pool lives on a private event loop thread so it can be shared by any thread.
+    def __init__(self, cfg: BrowserCfg = BrowserCfg()):
+        self.cfg = cfg
+        self._pool = AsyncBrowserPool(cfg=cfg)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="browser-pool", daemon=True)
+        self._thread.start()
+        self._closed = False
+
+    def fetch(self,
+              url: str,
+              wait_until: WaitUntil = "load",
+              timeout: float | None = None,
+              cancellation: Cancellation | None = None) -> str:
+        if self._closed:
+            raise RuntimeError("The browser pool has been closed.")
+        timeout = self.cfg.navigation_timeout if timeout is None else timeout
+        future = asyncio.run_coroutine_threadsafe(self._pool.fetch(url, wait_until=wait_until, timeout=timeout),
+                                                  self._loop)
+        if cancellation is not None:
+            # Cancelling the coroutine closes the navigation and gives the page back to the pool.
+            cancellation.add_callback(future.cancel)
+        try:
+            # Pages may queue behind the page cap, the extra time avoids cancelling them while waiting for a slot.
+            return future.result(timeout=2 * timeout)
+        except TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Impossible to load the page {url}")
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        asyncio.run_coroutine_threadsafe(self._pool.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+_shared_pool: BrowserPool | None = None
+_shared_pool_lock = threading.Lock()
+
+
+def get_browser_pool() -> BrowserPool:
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = BrowserPool()
+        return _shared_pool
+
+
+def close_browser_pool() -> None:
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is not None:
+            _shared_pool.close()
+            _shared_pool = None
+
+
+atexit.register(close_browser_pool)
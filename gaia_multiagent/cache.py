@@ -0,0 +1,389 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from enum import StrEnum
+from typing import Callable
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from gaia_multiagent.cfg import CacheCfg
+from gaia_multiagent.extraction import EXTRACTION_VERSION
+from gaia_multiagent.tracing import record
+
+
+class CacheMissError(KeyError):
+    pass
+
+
+class DiskCache:
+    # SQLite in WAL mode lets several worker processes read and write the same cache file.
+    def __init__(self, path: str, max_bytes: int, ttl: float | None = None):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30., isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, size INTEGER, "
+                         "cost REAL, created REAL, accessed REAL, label TEXT)")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            self._local.conn = conn
+        return conn
+
+    def record_lookup(self, hit: bool, cost: float = 0.) -> None:
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+                self.saved_seconds += cost
+            else:
+                self.misses += 1
+
+    def get(self, key: str) -> bytes | None:
+        now = time.time()
+        row = self._conn.execute("SELECT value, cost, created FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None or (self.ttl is not None and now - row[2] > self.ttl):
+            self.record_lookup(hit=False)
+            return None
+        self._conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        self.record_lookup(hit=True, cost=row[1])
+        return zlib.decompress(row[0])
+
+    def set(self, key: str, value: bytes, cost: float = 0., label: str | None = None) -> None:
+        blob = zlib.compress(value)
+        now = time.time()
+        self._conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           (key, blob, len(blob), cost, now, now, label))
+        self.evict()
+
+    def labels(self, since: float = 0.) -> list[tuple[str, str, float]]:
+        return self._conn.execute("SELECT key, label, created FROM entries WHERE created > ? AND label IS NOT NULL",
+                                  (since,)).fetchall()
+
+    def evict(self) -> None:
+        conn = self._conn
+        if self.ttl is not None:
+            conn.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.ttl,))
+        excess = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+        # Least recently used entries go first until the cache is back under its size bound.
+        to_delete = []
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed"):
+            to_delete.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM entries WHERE key = ?", to_delete)
+
+    def stats(self) -> dict[str, float]:
+        total = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total > 0 else 0.,
+                "saved_seconds": self.saved_seconds}
+
+
+def normalize_url(url: str) -> str:
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme, netloc.rsplit(":", 1)[-1]) in [("http", "80"), ("https", "443")]:
+        netloc = netloc.rsplit(":", 1)[0]
+    path = parts.path.rstrip("/") or "/"
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not k.startswith("utm_"))
+    return urlunsplit((scheme, netloc, path, urlencode(query), ""))
+
+
+class PageCache:
+    def __init__(self, cfg: CacheCfg = CacheCfg()):
+        self.cfg = cfg
+        self.store = DiskCache(path=os.path.join(cfg.cache_dir, "pages.sqlite"),
+                               max_bytes=cfg.page_max_bytes,
+                               ttl=cfg.page_ttl)
+
+    @staticmethod
+    def key(url: str) -> str:
+        return hashlib.sha256(f"{EXTRACTION_VERSION}|{normalize_url(url)}".encode()).hexdigest()
+
+    def get(self, url: str) -> str | None:
+        content = self.store.get(self.key(url))
+        return None if content is None else content.decode()
+
+    def set(self, url: str, content: str, cost: float = 0.) -> None:
+        self.store.set(self.key(url), content.encode(), cost=cost, label=normalize_url(url))
+
+    def stats(self) -> dict[str, float]:
+        return self.store.stats()
+
+
+_STOPWORDS = frozenset(["a", "an", "and", "are", "at", "by", "for", "from", "how", "in", "is", "it", "of", "on",
+                        "or", "the", "to", "was", "what", "when", "where", "which", "who", "with"])
+
+
+def query_tokens(query: str) -> frozenset[str]:
+    tokens = re.findall(r"\w+", query.lower())
+    return frozenset(t for t in tokens if t not in _STOPWORDS) or frozenset(tokens)
+
+
+class SearchCache:
+    # Queries live in an in-memory inverted index so near-duplicate lookups never touch the disk.
+    def __init__(self, cfg: CacheCfg = CacheCfg()):
+        self.cfg = cfg
+        self.store = DiskCache(path=os.path.join(cfg.cache_dir, "search.sqlite"),
+                               max_bytes=cfg.search_max_bytes,
+                               ttl=cfg.search_ttl)
+        self.near_duplicates = 0
+        self._queries: dict[str, dict[str, frozenset[str]]] = {}
+        self._postings: dict[str, dict[str, set[str]]] = {}
+        self._loaded_until = 0.
+        self._lock = threading.Lock()
+        self.refresh()
+
+    @staticmethod
+    def key(tokens: frozenset[str], namespace: str) -> str:
+        return hashlib.sha256(f"{namespace}|{' '.join(sorted(tokens))}".encode()).hexdigest()
+
+    def _index(self, key: str, tokens: frozenset[str], namespace: str) -> None:
+        self._queries.setdefault(namespace, {})[key] = tokens
+        postings = self._postings.setdefault(namespace, {})
+        for token in tokens:
+            postings.setdefault(token, set()).add(key)
+
+    def refresh(self) -> None:
+        # Picks up queries cached by other processes since the last refresh.
+        with self._lock:
+            for key, label, created in self.store.labels(since=self._loaded_until):
+                namespace, tokens = label.rsplit("|", 1)
+                self._index(key, frozenset(tokens.split(" ")), namespace)
+                self._loaded_until = max(self._loaded_until, created)
+
+    def _forget(self, key: str, namespace: str) -> None:
+        tokens = self._queries.get(namespace, {}).pop(key, frozenset())
+        for token in tokens:
+            self._postings[namespace][token].discard(key)
+
+    def _match(self, tokens: frozenset[str], namespace: str) -> str | None:
+        queries = self._queries.get(namespace, {})
+        key = self.key(tokens, namespace)
+        if key in queries:
+            return key
+        overlaps: dict[str, int] = {}
+        for token in tokens:
+            for candidate in self._postings.get(namespace, {}).get(token, ()):
+                overlaps[candidate] = overlaps.get(candidate, 0) + 1
+        best, best_score = None, self.cfg.search_similarity
+        for candidate, overlap in overlaps.items():
+            score = overlap / len(tokens | queries[candidate])
+            if score >= best_score:
+                best, best_score = candidate, score
+        return best
+
+    def get(self, query: str, namespace: str = "default") -> list[dict] | None:
+        tokens = query_tokens(query)
+        with self._lock:
+            key = self._match(tokens, namespace)
+        if key is None:
+            self.refresh()
+            with self._lock:
+                key = self._match(tokens, namespace)
+        if key is None:
+            self.store.record_lookup(hit=False)
+            return None
+        value = self.store.get(key)
+        if value is None:
+            # Evicted or expired in the meantime.
+            with self._lock:
+                self._forget(key, namespace)
+            return None
+        if key != self.key(tokens, namespace):
+            with self._lock:
+                self.near_duplicates += 1
+        return json.loads(value)
+
+    def set(self, query: str, results: list[dict], cost: float = 0., namespace: str = "default") -> None:
+        tokens = query_tokens(query)
+        key = self.key(tokens, namespace)
+        self.store.set(key, json.dumps(results).encode(), cost=cost, label=f"{namespace}|{' '.join(sorted(tokens))}")
+        with self._lock:
+            self._index(key, tokens, namespace)
+
+    def stats(self) -> dict[str, float]:
+        return self.store.stats() | {"near_duplicates": self.near_duplicates}
+
+
+class CacheMode(StrEnum):
+    RECORD = "record"
+    REPLAY = "replay"
+    PASSTHROUGH = "passthrough"
+
+
+def file_hash(filepath: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    # Generation runs at temperature 0, so a response is reusable as long as everything it depends on is in the key.
+    def __init__(self, cfg: CacheCfg = CacheCfg()):
+        self.cfg = cfg
+        self.mode = CacheMode(cfg.response_mode)
+        self.store = DiskCache(path=os.path.join(cfg.cache_dir, "responses.sqlite"),
+                               max_bytes=cfg.response_max_bytes)
+
+    @staticmethod
+    def key(**parts) -> str:
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=repr).encode()).hexdigest()
+
+    def __call__(self, key: str, call: Callable[[], str]) -> str:
+        if self.mode == CacheMode.PASSTHROUGH:
+            return call()
+        response = self.store.get(key)
+        if response is not None:
+            record(response_cache_hits=1)
+            return response.decode()
+        if self.mode == CacheMode.REPLAY:
+            raise CacheMissError(f"No recorded response for request {key} and the cache is in replay mode.")
+        start = time.perf_counter()
+        response = call()
+        if response is not None:
+            self.store.set(key, response.encode(), cost=time.perf_counter() - start)
+        return response
+
+    def stats(self) -> dict[str, float]:
+        return self.store.stats()
+
+
+class VerdictCache:
+    # A resubmitted answer gets the same verdict without a new call. Verdicts are kept in memory for the run, and
+    # persisted with the recorded responses only when the response cache records or replays.
+    version = 1
+
+    def __init__(self, cfg: CacheCfg = CacheCfg()):
+        self.cfg = cfg
+        self.mode = CacheMode(cfg.response_mode)
+        self.store = None
+        if self.mode != CacheMode.PASSTHROUGH:
+            self.store = DiskCache(path=os.path.join(cfg.cache_dir, "verdicts.sqlite"), max_bytes=cfg.verdict_max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self._verdicts: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def key(cls, **parts) -> str:
+        return hashlib.sha256(json.dumps({**parts, "version": cls.version}, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            verdict = self._verdicts.get(key, None)
+        if verdict is None and self.store is not None:
+            value = self.store.get(key)
+            verdict = None if value is None else value.decode()
+        with self._lock:
+            if verdict is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._verdicts[key] = verdict
+        return verdict
+
+    def set(self, key: str, verdict: str, cost: float = 0.) -> None:
+        with self._lock:
+            self._verdicts[key] = verdict
+        if self.store is not None:
+            self.store.set(key, verdict.encode(), cost=cost)
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total > 0 else 0.}
+
+
+class CachedPageVisit:
+    def __init__(self, visit_tool: Callable[[str], str], cache: PageCache | None = None):
+        self.visit_tool = visit_tool
+        self.cache = cache if cache is not None else get_page_cache()
+
+    def __call__(self, url: str) -> str:
+        content = self.cache.get(url)
+        if content is not None:
+            record(page_cache_hits=1)
+            return content
+        if self.cache.cfg.cache_only:
+            raise CacheMissError(f"Page {url} is not in the cache and the cache is in cache-only mode.")
+        start = time.perf_counter()
+        content = self.visit_tool(url)
+        self.cache.set(url, content, cost=time.perf_counter() - start)
+        return content
+
+
+_cache_cfg = CacheCfg()
+_page_cache: PageCache | None = None
+_search_cache: SearchCache | None = None
+_response_cache: ResponseCache | None = None
+_verdict_cache: VerdictCache | None = None
+_caches_lock = threading.Lock()
+
+
+def configure_caches(cfg: CacheCfg) -> None:
+    global _cache_cfg, _page_cache, _search_cache, _response_cache, _verdict_cache
+    with _caches_lock:
+        _cache_cfg = cfg
+        _page_cache = None
+        _search_cache = None
+        _response_cache = None
+        _verdict_cache = None
+
+
+def get_cache_cfg() -> CacheCfg:
+    return _cache_cfg
+
+
+def get_page_cache() -> PageCache:
+    global _page_cache
+    with _caches_lock:
+        if _page_cache is None:
+            _page_cache = PageCache(cfg=_cache_cfg)
+        return _page_cache
+
+
+def get_search_cache() -> SearchCache:
+    global _search_cache
+    with _caches_lock:
+        if _search_cache is None:
+            _search_cache = SearchCache(cfg=_cache_cfg)
+        return _search_cache
+
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    with _caches_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(cfg=_cache_cfg)
+        return _response_cache
+
+
+def get_verdict_cache() -> VerdictCache:
+    global _verdict_cache
+    with _caches_lock:
+        if _verdict_cache is None:
+            _verdict_cache = VerdictCache(cfg=_cache_cfg)
+        return _verdict_cache
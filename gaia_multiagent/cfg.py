@@ -18,6 +18,18 @@ class GenerationCfg:
     stop_sequences: list[str] = field(default_factory=lambda: ["END"])
 
 
+@dataclass(frozen=True)
+class PageReaderCfg:
+    max_page_tokens: int = 8_000
+    map_reduce_tokens: int = 100_000
+    max_map_sections: int = 8
+    map_workers: int = 4
+    chunk_size: int = 2048
+    chunk_overlap: int = 128
+    chars_per_token: int = 4
+    embedding_model: str = "sentence-transformers/all-mpnet-base-v2"
+
+
 @dataclass(frozen=True)
 class SearchAssistantCfg:
     retriever_cfg: RetrieverCfg = RetrieverCfg()
@@ -25,3 +37,97 @@ class SearchAssistantCfg:
     verbosity_level: int = 1
     planning_interval: int = 5
     embedding_model = "sentence-transformers/all-MiniLM-L6-v2" #TODO: CHANGE THIS TO A BETTER EMBEDDING MODEL
+
+
+@dataclass(frozen=True)
+class CacheCfg:
+    cache_dir: str = ".cache"
+    page_ttl: float | None = 7 * 24 * 3600.
+    page_max_bytes: int = 512 * 1024 ** 2
+    search_ttl: float | None = 7 * 24 * 3600.
+    search_max_bytes: int = 256 * 1024 ** 2
+    search_similarity: float = 0.8
+    embedding_capacity: int = 100_000
+    response_mode: str = "passthrough"
+    response_max_bytes: int = 256 * 1024 ** 2
+    verdict_max_bytes: int = 16 * 1024 ** 2
+    cache_only: bool = False
+
+
+@dataclass(frozen=True)
+class VerifierCfg:
+    max_field_chars: int = 2_000
+    format_checks: bool = True
+
+
+@dataclass(frozen=True)
+class TabularCfg:
+    inline_max_cells: int = 2_000
+    sample_rows: int = 5
+
+
+@dataclass(frozen=True)
+class CompactionCfg:
+    enabled: bool = False
+    token_budget: int = 20_000
+    keep_recent_steps: int = 2
+    digest_chars: int = 300
+    min_chars: int = 1_000
+    chars_per_token: int = 4
+
+
+@dataclass(frozen=True)
+class HedgeCfg:
+    enabled: bool = False
+    percentile: float = 0.95
+    min_samples: int = 20
+    window: int = 500
+    max_extra_fraction: float = 0.05
+    max_workers: int = 64
+
+
+@dataclass(frozen=True)
+class TracingCfg:
+    trace_dir: str = "traces"
+    otel: bool = False
+
+
+@dataclass(frozen=True)
+class RunnerCfg:
+    workers: int = 1
+    executor: str = "thread"
+    task_timeout: float | None = None
+    requests_per_minute: dict[str, int] = field(default_factory=lambda: {"gemini-2.0-flash": 15,
+                                                                         "gemini-2.5-flash-preview-04-17": 10})
+    tokens_per_minute: dict[str, int] = field(default_factory=lambda: {"gemini-2.0-flash": 1_000_000,
+                                                                       "gemini-2.5-flash-preview-04-17": 250_000})
+    cache_cfg: CacheCfg = CacheCfg()
+    embedding_server_port: int | None = None
+    tracing_cfg: TracingCfg = TracingCfg()
+    hedge_cfg: HedgeCfg = HedgeCfg()
+    compaction_cfg: CompactionCfg = CompactionCfg()
+
+
+@dataclass(frozen=True)
+class BrowserCfg:
+    headless: bool = True
+    max_pages: int = 4
+    recycle_after: int = 20
+    navigation_timeout: float = 30.
+
+
+@dataclass(frozen=True)
+class FetchCfg:
+    http_timeout: float = 10.
+    pool_size: int = 16
+    min_text_chars: int = 300
+    shell_text_chars: int = 2_000
+    user_agent: str = ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 "
+                       "Safari/537.36")
+    spa_domains: tuple[str, ...] = ("x.com", "twitter.com", "instagram.com", "facebook.com", "linkedin.com",
+                                    "tiktok.com", "threads.net")
+
+
+@dataclass(frozen=True)
+class ExtractCfg:
+    fast_path_chars: int = 500_000
@@ -0,0 +1,89 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from gaia_multiagent.cfg import CompactionCfg
+
+
+class ObservationStore:
+    # Full text of the compacted observations, so that the agents can read them again on request.
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self._items: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, text: str) -> str:
+        key = "obs-" + hashlib.sha1(text.encode()).hexdigest()[:10]
+        with self._lock:
+            self._items[key] = text
+            self._items.move_to_end(key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+        return key
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            return self._items.get(key, None)
+
+
+def estimate_tokens(system: str, contents: list[dict], chars_per_token: int = 4) -> int:
+    return (len(system) + sum(len(c["parts"][0]["text"]) for c in contents)) // chars_per_token
+
+
+class HistoryCompactor:
+    # Past the token budget, the observations older than the recent steps are replaced by their beginning and a
+    # reference to the full text. The first message (the task) and the model's own outputs are never touched. Every
+    # old observation is compacted at once, so that the compacted prefix stays the same from one step to the next.
+    def __init__(self, cfg: CompactionCfg = CompactionCfg(), store: ObservationStore | None = None):
+        self.cfg = cfg
+        self.store = store if store is not None else get_observation_store()
+
+    def digest(self, text: str) -> str:
+        key = self.store.put(text)
+        return (f"{text[:self.cfg.digest_chars]}\n[... observation {key} compacted from {len(text)} characters, "
+                f"call RecallObservation(observation_id=\"{key}\") to read it in full]")
+
+    def recent_start(self, contents: list[dict]) -> int:
+        # A step sends several messages (the model output, the tool call and its response), each step starts at a
+        # model message that follows a user one.
+        steps = 0
+        for i in range(len(contents) - 1, 0, -1):
+            if contents[i]["role"] == "model" and contents[i - 1]["role"] != "model":
+                steps += 1
+                if steps == self.cfg.keep_recent_steps:
+                    return i
+        return 0
+
+    def compact(self, system: str, contents: list[dict]) -> list[dict]:
+        if not self.cfg.enabled or estimate_tokens(system, contents, self.cfg.chars_per_token) <= self.cfg.token_budget:
+            return contents
+        recent = self.recent_start(contents)
+        compacted = []
+        for i, content in enumerate(contents):
+            text = content["parts"][0]["text"]
+            if 0 < i < recent and content["role"] == "user" and len(text) > self.cfg.min_chars:
+                content = {"role": "user", "parts": [{"text": self.digest(text)}]}
+            compacted.append(content)
+        return compacted
+
+
+_compaction_cfg = CompactionCfg()
+_observation_store: ObservationStore | None = None
+_observation_store_lock = threading.Lock()
+
+
+def configure_compaction(cfg: CompactionCfg) -> None:
+    global _compaction_cfg
+    _compaction_cfg = cfg
+
+
+def get_compaction_cfg() -> CompactionCfg:
+    return _compaction_cfg
+
+
+def get_observation_store() -> ObservationStore:
+    global _observation_store
+    with _observation_store_lock:
+        if _observation_store is None:
+            _observation_store = ObservationStore()
+        return _observation_store
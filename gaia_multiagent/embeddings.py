@@ -0,0 +1,324 @@
+import fcntl
+import hashlib
+import multiprocessing
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from multiprocessing.managers import BaseManager, DictProxy
+from typing import Iterator
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from gaia_multiagent.cache import get_cache_cfg
+from gaia_multiagent.cfg import CacheCfg
+from gaia_multiagent.tracing import span
+
+EMBEDDING_SERVER_ENV = "GAIA_EMBEDDING_SERVER"
+EMBEDDING_SERVER_AUTHKEY = b"gaia_multiagent"
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class EmbeddingCache:
+    # Vectors live in a preallocated float32 memmap shared by all processes, the SQLite index maps text hashes to rows.
+    def __init__(self, model_name: str, cfg: CacheCfg | None = None):
+        cfg = cfg if cfg is not None else get_cache_cfg()
+        self.model_name = model_name
+        self.capacity = cfg.embedding_capacity
+        self.folder = os.path.join(cfg.cache_dir, "embeddings", hashlib.sha256(model_name.encode()).hexdigest()[:16])
+        os.makedirs(self.folder, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._vectors: np.memmap | None = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.folder, "index.sqlite"), timeout=30., isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("CREATE TABLE IF NOT EXISTS rows (hash TEXT PRIMARY KEY, row INTEGER UNIQUE)")
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('model_name', ?)", (self.model_name,))
+            stored = conn.execute("SELECT value FROM meta WHERE key = 'model_name'").fetchone()[0]
+            if stored != self.model_name:
+                raise RuntimeError(f"Embedding cache in {self.folder} belongs to {stored}, not {self.model_name}.")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _file_lock(self, shared: bool = False) -> Iterator[None]:
+        # Readers share the lock, so that they never see a row whose vector is being overwritten.
+        with open(os.path.join(self.folder, "lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _meta(self, key: str) -> str | None:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def _open_vectors(self, dim: int | None = None) -> np.memmap | None:
+        if self._vectors is not None:
+            return self._vectors
+        stored_dim = self._meta("dim")
+        if stored_dim is None and dim is None:
+            return None
+        dim = int(stored_dim) if stored_dim is not None else dim
+        path = os.path.join(self.folder, "vectors.f32")
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.truncate(self.capacity * dim * 4)
+        self._vectors = np.memmap(path, dtype=np.float32, mode="r+", shape=(self.capacity, dim))
+        return self._vectors
+
+    def get(self, hashes: list[str]) -> dict[str, np.ndarray]:
+        out = {}
+        with self._file_lock(shared=True):
+            vectors = self._open_vectors()
+            if vectors is not None and len(hashes) > 0:
+                placeholders = ",".join("?" * len(hashes))
+                rows = self._conn.execute(f"SELECT hash, row FROM rows WHERE hash IN ({placeholders})",
+                                          hashes).fetchall()
+                out = {h: np.array(vectors[r]) for h, r in rows}
+        with self._lock:
+            self.hits += len(out)
+            self.misses += len(set(hashes)) - len(out)
+        return out
+
+    def put(self, hashes: list[str], vectors: np.ndarray) -> None:
+        if len(hashes) == 0:
+            return
+        with self._file_lock():
+            conn = self._conn
+            if self._meta("dim") is None:
+                conn.execute("INSERT INTO meta VALUES ('dim', ?)", (str(vectors.shape[1]),))
+            store = self._open_vectors(dim=vectors.shape[1])
+            next_row = int(self._meta("next_row") or 0)
+            # Rows are reused in insertion order once the cache is full, which bounds its size.
+            rows = [(next_row + i) % self.capacity for i in range(len(hashes))]
+            # The vectors are in place before the index points to them, and the rows change owner in one transaction.
+            store[rows] = vectors
+            store.flush()
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("DELETE FROM rows WHERE row = ?", [(r,) for r in rows])
+            conn.executemany("INSERT OR REPLACE INTO rows VALUES (?, ?)", list(zip(hashes, rows)))
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('next_row', ?)",
+                         (str((next_row + len(hashes)) % self.capacity),))
+            conn.execute("COMMIT")
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total > 0 else 0.}
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.embedding_seconds = 0.
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        with span("embeddings") as s:
+            hashes = [text_hash(t) for t in texts]
+            found = self.cache.get(list(set(hashes)))
+            missing = {h: t for h, t in zip(hashes, texts) if h not in found}
+            s.add(embedding_cache_hits=len(found), embedded_chunks=len(missing))
+            if len(missing) > 0:
+                start = time.perf_counter()
+                vectors = np.asarray(self.embeddings.embed_documents(list(missing.values())), dtype=np.float32)
+                self.embedding_seconds += time.perf_counter() - start
+                self.cache.put(list(missing.keys()), vectors)
+                found.update(zip(missing.keys(), vectors))
+            return [found[h].tolist() for h in hashes]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embeddings.embed_query(text)
+
+
+class _EmbeddingRequest:
+    def __init__(self, texts: list[str]):
+        self.texts = texts
+        self.future = Future()
+
+
+class EmbeddingService(Embeddings):
+    # Concurrent callers are coalesced into large batches, flushed when full or after max_latency seconds.
+    def __init__(self,
+                 model_name: str,
+                 max_batch_size: int = 256,
+                 max_latency: float = 0.02,
+                 model: Embeddings | None = None):
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        if model is None:
+            from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+            model = HuggingFaceEmbeddings(model_name=model_name)
+        self.model = model
+        self.chunks = 0
+        self.batches = 0
+        self.busy_seconds = 0.
+        self._queue: queue.Queue[_EmbeddingRequest] = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name=f"embeddings-{model_name}", daemon=True)
+        self._worker.start()
+
+    def _next_batch(self) -> list[_EmbeddingRequest]:
+        batch = [self._queue.get()]
+        size = len(batch[0].texts)
+        deadline = time.monotonic() + self.max_latency
+        while size < self.max_batch_size:
+            try:
+                request = self._queue.get(timeout=max(0., deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            start = time.perf_counter()
+            try:
+                vectors = self.model.embed_documents([t for request in batch for t in request.texts])
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            # Counted before the callers are released, so that they see their own batch in the stats.
+            self.busy_seconds += time.perf_counter() - start
+            self.batches += 1
+            self.chunks += len(vectors)
+            offset = 0
+            for request in batch:
+                request.future.set_result(vectors[offset:offset + len(request.texts)])
+                offset += len(request.texts)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if len(texts) == 0:
+            return []
+        request = _EmbeddingRequest(texts)
+        self._queue.put(request)
+        return request.future.result()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> dict[str, float]:
+        return {"chunks": self.chunks,
+                "batches": self.batches,
+                "mean_batch_size": self.chunks / self.batches if self.batches > 0 else 0.,
+                "chunks_per_second": self.chunks / self.busy_seconds if self.busy_seconds > 0 else 0.,
+                "queue_depth": self._queue.qsize()}
+
+
+_services: dict[str, EmbeddingService] = {}
+_services_lock = threading.Lock()
+
+
+def get_embedding_service(model_name: str) -> EmbeddingService:
+    with _services_lock:
+        if model_name not in _services:
+            _services[model_name] = EmbeddingService(model_name=model_name)
+        return _services[model_name]
+
+
+def set_embedding_service(service: EmbeddingService) -> None:
+    with _services_lock:
+        _services[service.model_name] = service
+
+
+def _loaded_service_stats() -> dict[str, dict[str, float]]:
+    # Only the models already loaded, asking for stats must not load one.
+    with _services_lock:
+        return {name: service.stats() for name, service in _services.items()}
+
+
+class EmbeddingManager(BaseManager):
+    pass
+
+
+EmbeddingManager.register("get_service", callable=get_embedding_service,
+                          exposed=("embed_documents", "embed_query", "stats"))
+EmbeddingManager.register("service_stats", callable=_loaded_service_stats, proxytype=DictProxy)
+
+
+def serve_embeddings(address: tuple[str, int], authkey: bytes = EMBEDDING_SERVER_AUTHKEY) -> None:
+    # Each client connection is served by its own thread, so requests of several workers end up in the same batches.
+    EmbeddingManager(address=address, authkey=authkey).get_server().serve_forever()
+
+
+def start_embedding_server(address: tuple[str, int], timeout: float = 30.) -> multiprocessing.Process:
+    process = multiprocessing.Process(target=serve_embeddings, args=(address,), name="embedding-server", daemon=True)
+    process.start()
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            EmbeddingManager(address=address, authkey=EMBEDDING_SERVER_AUTHKEY).connect()
+            break
+        except ConnectionError:
+            if time.monotonic() > deadline or not process.is_alive():
+                process.terminate()
+                raise RuntimeError(f"Embedding server at {address} did not start.")
+            time.sleep(0.1)
+    os.environ[EMBEDDING_SERVER_ENV] = f"{address[0]}:{address[1]}"
+    return process
+
+
+class RemoteEmbeddings(Embeddings):
+    def __init__(self, model_name: str, address: tuple[str, int], authkey: bytes = EMBEDDING_SERVER_AUTHKEY):
+        self.model_name = model_name
+        self.address = address
+        self.authkey = authkey
+        self._local = threading.local()
+
+    @property
+    def _service(self):
+        # Manager proxies are not thread safe, each thread gets its own connection.
+        service = getattr(self._local, "service", None)
+        if service is None:
+            manager = EmbeddingManager(address=self.address, authkey=self.authkey)
+            manager.connect()
+            service = manager.get_service(self.model_name)
+            self._local.service = service
+        return service
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._service.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._service.embed_query(text)
+
+    def stats(self) -> dict[str, float]:
+        return self._service.stats()
+
+
+def get_embeddings(model_name: str) -> Embeddings:
+    server = os.getenv(EMBEDDING_SERVER_ENV, None)
+    if server is None:
+        return get_embedding_service(model_name)
+    host, port = server.rsplit(":", 1)
+    return RemoteEmbeddings(model_name=model_name, address=(host, int(port)))
+
+
+def embedding_stats() -> dict[str, dict[str, float]]:
+    # Per model, from the shared embedding server when the workers use one.
+    server = os.getenv(EMBEDDING_SERVER_ENV, None)
+    if server is None:
+        return _loaded_service_stats()
+    host, port = server.rsplit(":", 1)
+    manager = EmbeddingManager(address=(host, int(port)), authkey=EMBEDDING_SERVER_AUTHKEY)
+    manager.connect()
+    return manager.service_stats().copy()
@@ -1,18 +1,32 @@
-import copy
+import base64
+import hashlib
 import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from functools import cached_property
 from dataclasses import dataclass
-from google import genai
-from google.genai.types import GenerateContentConfig, ThinkingConfig
-from smolagents import Model, Tool, ChatMessage
-from tenacity import wait_exponential, stop_after_attempt, retry
+from typing import TYPE_CHECKING, Any
+from smolagents import Model
+from tenacity import retry, retry_if_exception, stop_after_attempt
 from importlib import resources
 
 from gaia_multiagent import prompts
-from gaia_multiagent.cfg import GenerationCfg
+from gaia_multiagent.cache import ResponseCache, file_hash, get_response_cache, get_verdict_cache
+from gaia_multiagent.cfg import CompactionCfg, GenerationCfg, VerifierCfg
+from gaia_multiagent.compaction import HistoryCompactor, estimate_tokens, get_compaction_cfg
+from gaia_multiagent.hedging import get_hedger
+from gaia_multiagent.rate_limit import GeminiBackoff, get_rate_limiter, is_transient
+from gaia_multiagent.tracing import propagate, record, span
 from gaia_multiagent.utils import VerificationError
+from gaia_multiagent.verification import compact_trace, format_issues, normalize_answer
 import time
 
+if TYPE_CHECKING:
+    from google import genai
+
+gemini_retry = retry(wait=GeminiBackoff(), stop=stop_after_attempt(5), retry=retry_if_exception(is_transient),
+                     reraise=True)
+
 @dataclass
 class GeminiOutput:
     content: str
@@ -21,116 +35,316 @@ class GeminiOutput:
 class GeminiClient:
 
     @cached_property
-    def client(self) -> genai.Client:
+    def client(self) -> "genai.Client":
+        from google import genai
         api_key = os.getenv("GEMINI_API_KEY", None)
         if api_key is None:
             raise ValueError("GEMINI_API_KEY environment variable is not set. Please set it to use Gemini model.")
         return genai.Client(api_key=api_key)
 
-    def clear_all_files(self) -> None:
-        files = self.client.files.list()
-        for file in files:
-            self.client.files.delete(name=file.name)
+    @cached_property
+    def response_cache(self) -> ResponseCache:
+        return get_response_cache()
+
+    def generate_content(self, contents: Any, config: Any, prompt_chars: int) -> Any:
+        limiter = get_rate_limiter(self.model_id)
+        estimate = prompt_chars // 4
+        throttled = limiter.acquire(tokens=estimate)
+        start = time.perf_counter()
+        # Only the API call is hedged, a duplicate is sent only if the rate limit has room for it.
+        response = get_hedger().call(f"gemini/{self.model_id}",
+                                     lambda cancellation: self.client.models.generate_content(model=self.model_id,
+                                                                                              contents=contents,
+                                                                                              config=config),
+                                     before_hedge=lambda: limiter.try_acquire(tokens=estimate))
+        usage = getattr(response, "usage_metadata", None)
+        used = getattr(usage, "total_token_count", None)
+        limiter.record(seconds=time.perf_counter() - start, tokens=estimate if used is None else used, estimate=estimate)
+        record(api_calls=1, throttled_seconds=throttled,
+               input_tokens=getattr(usage, "prompt_token_count", None) or estimate,
+               output_tokens=getattr(usage, "candidates_token_count", None) or 0)
+        return response
 
 
 class GeminiEngine(GeminiClient, Model):
+    roles = {"assistant": "model", "user": "user", "tool-call": "model", "tool-response": "user"}
+
     def __init__(self,
                  model_id: str,
                  cfg: GenerationCfg = GenerationCfg(),
+                 max_memoized_histories: int = 8,
+                 compaction_cfg: CompactionCfg | None = None,
                  ):
         super().__init__()
         self.cfg = cfg
         self.model_id = model_id
+        self.max_memoized_histories = max_memoized_histories
+        self.compactor = HistoryCompactor(compaction_cfg if compaction_cfg is not None else get_compaction_cfg())
+        # Converted history of the last call of each agent, keyed by its system prompt.
+        self._converted: dict[str, list[tuple[str, str, dict]]] = {}
+        self._converted_lock = threading.Lock()
 
-    @staticmethod
-    def format_role(message: dict) -> dict:
-        message = copy.deepcopy(message)
-        if message["role"] == "assistant":
-            out = {"role": "model", "parts": [{"text": message["content"][0]["text"]}]}
-        elif message["role"] == "user":
-            out = {"role": "user", "parts": [{"text": message["content"][0]["text"]}]}
-        elif message["role"] == "tool-call":
-            out = {"role": "model", "parts": [{"text": message["content"][0]["text"]}]}
-        elif message["role"] == "tool-response":
-            out = {"role": "user", "parts": [{"text": message["content"][0]["text"]}]}
-        else:
-            raise RuntimeError(f"Unknown role {message["role"]}")
-        return out
+    @classmethod
+    def format_role(cls, message: dict) -> dict:
+        role = cls.roles.get(message["role"], None)
+        if role is None:
+            raise RuntimeError(f"Unknown role {message['role']}")
+        return {"role": role, "parts": [{"text": message["content"][0]["text"]}]}
+
+    def build_contents(self, messages: list[dict]) -> list[dict]:
+        system = messages[0]["content"][0]["text"]
+        with self._converted_lock:
+            previous = self._converted.get(system, [])
+        converted = []
+        shared_prefix = True
+        # Agents resend their whole memory each step, only the messages after the shared prefix need converting.
+        for i, message in enumerate(messages[1:]):
+            text = message["content"][0]["text"]
+            shared_prefix = (shared_prefix and i < len(previous)
+                             and previous[i][0] == message["role"] and previous[i][1] == text)
+            converted.append(previous[i] if shared_prefix else (message["role"], text, self.format_role(message)))
+        with self._converted_lock:
+            self._converted.pop(system, None)
+            self._converted[system] = converted
+            while len(self._converted) > self.max_memoized_histories:
+                self._converted.pop(next(iter(self._converted)))
+        return [content for _, _, content in converted]
 
-    @retry(wait=wait_exponential(multiplier=2, min=10, max=100), stop=stop_after_attempt(5))
     def generate(self, messages: list[dict], stop_sequences=None, **kwargs) -> GeminiOutput:
         if stop_sequences is None:
             stop_sequences = self.cfg.stop_sequences
+        system = messages[0]["content"][0]["text"]
+        full = self.build_contents(messages)
+        contents = self.compactor.compact(system, full)
+        key = self.response_cache.key(model_id=self.model_id, system=system, contents=contents,
+                                      temperature=self.cfg.temperature, max_tokens=self.cfg.max_tokens,
+                                      stop_sequences=stop_sequences)
+        with span("gemini.generate", model_id=self.model_id):
+            record(prompt_tokens=estimate_tokens(system, contents),
+                   uncompacted_prompt_tokens=estimate_tokens(system, full))
+            text = self.response_cache(key, lambda: self._generate(system, contents, stop_sequences))
+        return GeminiOutput(content=text)
 
-        messages = copy.deepcopy(messages)
-        history = [self.format_role(message) for message in messages[1:-1]]
-
-        chat = self.client.chats.create(model=self.model_id, history=history)
-        cfg = GenerateContentConfig(system_instruction=messages[0]["content"][0]["text"],
+    @gemini_retry
+    def _generate(self, system: str, contents: list[dict], stop_sequences: list[str]) -> str:
+        from google.genai.types import GenerateContentConfig
+        cfg = GenerateContentConfig(system_instruction=system,
                                     temperature=self.cfg.temperature,
                                     max_output_tokens=self.cfg.max_tokens,
                                     stop_sequences=stop_sequences)
-        response = chat.send_message(messages[-1]["content"][0]["text"], config=cfg)
-        return GeminiOutput(content=response.text)
+        prompt_chars = len(system) + sum(len(c["parts"][0]["text"]) for c in contents)
+        response = self.generate_content(contents=contents, config=cfg, prompt_chars=prompt_chars)
+        return response.text
 
     def __call__(self, *args, **kwargs):
         return self.generate(*args, **kwargs)
 
 
-
-
-
 class GeminiFileQA(GeminiClient):
     def __init__(self,
                  model_id: str,
                  filepath: str,
                  cfg: GenerationCfg = GenerationCfg(),
-                 max_wait_loading: int = 10
                  ):
-        self.file_id = self.client.files.upload(file=filepath)
+        self.filepath = filepath
+        self.file_hash = get_file_registry().content_hash(filepath)
         self.model_id = model_id
         self.cfg = cfg
-        self.max_wait_loading = max_wait_loading
+
+    @cached_property
+    def file_id(self):
+        # Resolved on first use, so replayed runs never upload anything.
+        return get_file_registry().get(self.filepath, content_hash=self.file_hash)
 
     def __call__(self, prompt: str) -> str:
+        key = self.response_cache.key(model_id=self.model_id, prompt=prompt, file_hash=self.file_hash,
+                                      temperature=self.cfg.temperature, max_tokens=self.cfg.max_tokens)
+        with span("gemini.file_qa", model_id=self.model_id):
+            return self.response_cache(key, lambda: self._generate(prompt))
+
+    @gemini_retry
+    def _generate(self, prompt: str) -> str:
+        from google.genai.types import GenerateContentConfig
         cfg = GenerateContentConfig(temperature=self.cfg.temperature,
                                     max_output_tokens=self.cfg.max_tokens,
                                     )
-        waited = 0
-        while self.client.files.get(name=self.file_id.name.split('/')[1]).state != "ACTIVE":
-            if waited > self.max_wait_loading:
-                raise RuntimeError(f"File {self.file_id} is not ready after {self.max_wait_loading} seconds.")
-            waited += 1
-            time.sleep(5)
-        response = self.client.models.generate_content(model=self.model_id, contents=[self.file_id, prompt], config=cfg)
+        response = self.generate_content(contents=[self.file_id, prompt], config=cfg, prompt_chars=len(prompt))
         return response.text
 
 
 class GeminiVerifier(GeminiClient):
-    instruction= resources.read_text(prompts, "verifier.txt")
 
     def __init__(self,
                  model_id: str,
                  cfg: GenerationCfg = GenerationCfg(),
-                 thinking_budget: int = 4096
+                 thinking_budget: int = 4096,
+                 verifier_cfg: VerifierCfg = VerifierCfg(),
                  ):
         self.model_id = model_id
         self.cfg = cfg
         self.thinking_budget = thinking_budget
+        self.verifier_cfg = verifier_cfg
+        self._format_rejected: set[str] = set()
 
+    @cached_property
+    def instruction(self) -> str:
+        return resources.read_text(prompts, "verifier.txt")
 
-
-    def verify(self, final_answer:str, agent_memory: any)-> str:
+    def verify(self, final_answer:str, agent_memory: any, question: str | None = None)-> str:
         execution_trace = agent_memory.get_succinct_steps()
         task = execution_trace[0]["task"]
-        execution_trace = execution_trace[1:]
-        prompt = f"{self.instruction}\nTask:{task}\nAI agent answer: {final_answer}\nExecution:{execution_trace}."
+        answer = normalize_answer(str(final_answer))
+        # The rules look at the question alone, the task prompt also holds the instructions and any attached file.
+        question = question if question is not None else task
+        with span("verify", model_id=self.model_id):
+            # Format mistakes are caught locally, the thinking model is only asked about the substance.
+            # An answer submitted again after a format rejection goes to the LLM, in case the rules misfired.
+            issues = []
+            if self.verifier_cfg.format_checks and answer not in self._format_rejected:
+                issues = format_issues(question, answer)
+            if len(issues) > 0:
+                self._format_rejected.add(answer)
+                record(format_rejections=1)
+                raise VerificationError(f"The final answer doesn't follow the required format: {'; '.join(issues)}.")
+            verdict_key = get_verdict_cache().key(model_id=self.model_id, task=task, answer=answer,
+                                                  instruction=hashlib.sha256(self.instruction.encode()).hexdigest(),
+                                                  thinking_budget=self.thinking_budget)
+            text = get_verdict_cache().get(verdict_key)
+            if text is not None:
+                record(verdict_cache_hits=1)
+            else:
+                trace = compact_trace(execution_trace[1:], self.verifier_cfg)
+                prompt = f"{self.instruction}\nTask:{task}\nAI agent answer: {answer}\nExecution:\n{trace}"
+                key = self.response_cache.key(model_id=self.model_id, prompt=prompt, temperature=self.cfg.temperature,
+                                              max_tokens=self.cfg.max_tokens, thinking_budget=self.thinking_budget)
+                start = time.perf_counter()
+                with span("gemini.verify", model_id=self.model_id):
+                    text = self.response_cache(key, lambda: self._generate(prompt))
+                get_verdict_cache().set(verdict_key, text, cost=time.perf_counter() - start)
+        print("EVALUATION: ", text)
+        if "[WRONG]" in text:
+            raise VerificationError(f"It seems you made a mistake. Results of the check: {text}")
+        else:
+            return text
+
+    @gemini_retry
+    def _generate(self, prompt: str) -> str:
+        from google.genai.types import GenerateContentConfig, ThinkingConfig
         cfg = GenerateContentConfig(temperature=self.cfg.temperature,
                                     max_output_tokens=self.cfg.max_tokens,
                                     thinking_config=ThinkingConfig(thinking_budget=self.thinking_budget))
-        response = self.client.models.generate_content(model=self.model_id, contents=prompt, config=cfg)
-        print("EVALUATION: ", response.text)
-        if "[WRONG]" in response.text:
-            raise VerificationError(f"It seems you made a mistake. Results of the check: {response.text}")
-        else:
-            return response.text
\ No newline at end of file
+        response = self.generate_content(contents=prompt, config=cfg, prompt_chars=len(prompt))
+        return response.text
+
+
+class FileRegistry(GeminiClient):
+    # Remote files are shared by content hash, only the files uploaded by this registry are deleted on cleanup.
+    def __init__(self, max_workers: int = 4, max_wait_loading: float = 120., max_poll_interval: float = 5.):
+        self.max_wait_loading = max_wait_loading
+        self.max_poll_interval = max_poll_interval
+        self.created: list[str] = []
+        self._files: dict[str, Future] = {}
+        self._hashes: dict[tuple[str, int, int], str] = {}
+        self._remote: dict[str, Any] | None = None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gemini-upload")
+        self._lock = threading.Lock()
+
+    def _remote_files(self) -> dict[str, Any]:
+        # Files left in the account by earlier runs, indexed by their SHA-256 (the API reports it base64 encoded).
+        if self._remote is None:
+            remote = {}
+            for file in self.client.files.list():
+                sha = getattr(file, "sha256_hash", None)
+                if sha:
+                    remote[sha] = file
+                    try:
+                        remote[base64.b64decode(sha).hex()] = file
+                    except ValueError:
+                        pass
+            self._remote = remote
+        return self._remote
+
+    def content_hash(self, filepath: str) -> str:
+        # Attachments are hashed once per process, the early upload and the file tools share the digest.
+        stat = os.stat(filepath)
+        key = (os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._hashes.get(key, None)
+        if digest is None:
+            digest = file_hash(filepath)
+            with self._lock:
+                self._hashes[key] = digest
+        return digest
+
+    def upload(self, filepath: str, content_hash: str | None = None) -> Future:
+        content_hash = self.content_hash(filepath) if content_hash is None else content_hash
+        with self._lock:
+            future = self._files.get(content_hash, None)
+            if future is None or (future.done() and future.exception() is not None):
+                future = self._executor.submit(propagate(self._upload), filepath, content_hash)
+                self._files[content_hash] = future
+        return future
+
+    def get(self, filepath: str, content_hash: str | None = None) -> Any:
+        with span("gemini.file_wait"):
+            return self.upload(filepath, content_hash=content_hash).result()
+
+    def _upload(self, filepath: str, content_hash: str) -> Any:
+        with span("gemini.upload", size=os.path.getsize(filepath)):
+            return self._upload_file(filepath, content_hash)
+
+    def _upload_file(self, filepath: str, content_hash: str) -> Any:
+        file = self._remote_files().get(content_hash, None)
+        if file is not None:
+            try:
+                return self.wait_active(file)
+            except RuntimeError:
+                pass
+        # mimetypes doesn't know .m4a, which YouTube audio-only streams are saved as.
+        config = {"mime_type": "audio/mp4"} if filepath.endswith(".m4a") else None
+        file = self.client.files.upload(file=filepath, config=config)
+        with self._lock:
+            self.created.append(file.name)
+        return self.wait_active(file)
+
+    def wait_active(self, file: Any) -> Any:
+        # Small files are usually ready in a few hundred milliseconds, the interval grows for large videos.
+        deadline = time.monotonic() + self.max_wait_loading
+        interval = 0.2
+        while True:
+            file = self.client.files.get(name=file.name)
+            state = getattr(file.state, "name", file.state)
+            if state == "ACTIVE":
+                return file
+            if state == "FAILED":
+                raise RuntimeError(f"Processing of file {file.name} failed.")
+            if time.monotonic() + interval > deadline:
+                raise RuntimeError(f"File {file.name} is not ready after {self.max_wait_loading} seconds.")
+            time.sleep(interval)
+            interval = min(self.max_poll_interval, interval * 1.5)
+
+    def cleanup(self) -> None:
+        with self._lock:
+            created, self.created = self.created, []
+            self._files.clear()
+            self._remote = None
+        list(self._executor.map(lambda name: self.client.files.delete(name=name), created))
+
+
+_registry: FileRegistry | None = None
+_registry_lock = threading.Lock()
+
+
+def get_file_registry() -> FileRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = FileRegistry()
+        return _registry
+
+
+def cleanup_uploads() -> None:
+    with _registry_lock:
+        registry = _registry
+    if registry is not None:
+        registry.cleanup()
@@ -0,0 +1,124 @@
+import re
+from typing import TYPE_CHECKING
+
+from gaia_multiagent.cfg import ExtractCfg
+
+if TYPE_CHECKING:
+    from bs4 import Tag
+
+# Part of the page cache key: bump it whenever the markdown extracted from a page changes, so that pages cached by an
+# older extraction are fetched again.
+EXTRACTION_VERSION = 2
+_REMOVED_TAGS = ["script", "style", "noscript", "template", "svg", "canvas", "iframe", "button", "input",
+                 "select", "nav", "aside", "footer"]
+_BOILERPLATE_ROLES = ["navigation", "banner", "contentinfo", "complementary", "search", "dialog"]
+_BOILERPLATE_RE = re.compile(r"(^|[-_])(cookie|consent|gdpr|banner|sidebar|navbox|navbar|menu|breadcrumbs?|footer|"
+                             r"advert|ads|share|social|newsletter|subscribe|popup|modal|related)([-_]|$)", re.I)
+_HEADINGS = frozenset(["h1", "h2", "h3", "h4", "h5", "h6"])
+_BLOCK_TAGS = frozenset(["p", "div", "section", "article", "main", "br", "li", "ul", "ol", "dl", "dt", "dd", "pre",
+                         "blockquote", "figure", "figcaption", "hr", "tr"]) | _HEADINGS
+
+
+def parser() -> str:
+    try:
+        import lxml  # noqa: F401
+        return "lxml"
+    except ImportError:
+        return "html.parser"
+
+
+def _is_boilerplate(tag: "Tag") -> bool:
+    if tag.attrs is None:
+        return False
+    if tag.get("role") in _BOILERPLATE_ROLES or tag.get("aria-hidden") == "true":
+        return True
+    names = tag.get("class", []) + [tag.get("id") or ""]
+    return any(_BOILERPLATE_RE.search(name) for name in names)
+
+
+def content_root(soup: "Tag") -> "Tag":
+    root = soup.find("main") or soup.find(attrs={"role": "main"})
+    if root is not None:
+        return root
+    articles = [a for a in soup.find_all("article") if a.find_parent("article") is None]
+    if len(articles) == 1:
+        return articles[0]
+    if len(articles) > 1:
+        # Forum threads, comment sections and indexes hold several articles: keep all of them, not just the first.
+        for parent in articles[0].parents:
+            # Tags compare equal by content, the common parent is matched by identity.
+            if all(any(p is parent for p in a.parents) for a in articles[1:]):
+                return parent
+    return soup.body or soup
+
+
+def extract_main_content(html: str) -> "Tag":
+    # Navigation, banners and sidebars would otherwise end up in every chunk, embedding and prompt of the page.
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, parser())
+    for tag in soup.find_all(_REMOVED_TAGS):
+        tag.decompose()
+    root = content_root(soup)
+    # Headers inside an article carry its title, page headers are site chrome.
+    if root.name not in ["main", "article"] and root.get("role") != "main":
+        for tag in root.find_all("header"):
+            if tag.find_parent("article") is None:
+                tag.decompose()
+    for tag in root.find_all(_is_boilerplate):
+        if not tag.decomposed and tag.find(["main", "article"]) is None:
+            tag.decompose()
+    return root
+
+
+def table_to_markdown(table: "Tag") -> str:
+    rows = []
+    for tr in table.find_all("tr"):
+        cells = [c.get_text(" ", strip=True).replace("|", "\\|") for c in tr.find_all(["th", "td"], recursive=False)]
+        if len(cells) > 0:
+            rows.append(cells)
+    if len(rows) == 0:
+        return ""
+    width = max(len(r) for r in rows)
+    lines = ["| " + " | ".join(r + [""] * (width - len(r))) + " |" for r in rows]
+    lines.insert(1, "|" + " --- |" * width)
+    return "\n".join(lines)
+
+
+def fast_markdown(root: "Tag") -> str:
+    # Single pass over the tree without modifying it: headings, list items and tables keep their structure, the rest
+    # becomes plain text.
+    from bs4 import NavigableString
+    parts = []
+    stack: list = [root]
+    while len(stack) > 0:
+        node = stack.pop()
+        if isinstance(node, tuple):
+            parts.append(node[0])
+        elif isinstance(node, NavigableString):
+            # Comments, doctypes and CDATA are NavigableString subclasses.
+            if type(node) is NavigableString:
+                parts.append(node)
+        elif node.name == "table":
+            parts.append("\n\n" + table_to_markdown(node) + "\n\n")
+        else:
+            if node.name in _BLOCK_TAGS:
+                parts.append("\n")
+                stack.append(("\n",))
+            if node.name in _HEADINGS:
+                parts.append("#" * int(node.name[1]) + " ")
+            elif node.name == "li":
+                parts.append("- ")
+            stack.extend(reversed(node.contents))
+    text = re.sub(r"[ \t\r\f\v]+", " ", "".join(parts))
+    text = "\n".join(line.strip() for line in text.split("\n"))
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def html_to_markdown(html: str, cfg: ExtractCfg = ExtractCfg()) -> str:
+    root = extract_main_content(html)
+    if len(html) > cfg.fast_path_chars:
+        return fast_markdown(root)
+    from markdownify import MarkdownConverter
+    # convert_soup reuses the parsed tree instead of parsing the page a second time.
+    return re.sub(r"\n{3,}", "\n\n", MarkdownConverter().convert_soup(root)).strip()
+
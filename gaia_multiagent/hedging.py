@@ -0,0 +1,186 @@
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, TypeVar
+
+from gaia_multiagent.cfg import HedgeCfg
+from gaia_multiagent.tracing import propagate, record
+
+T = TypeVar("T")
+
+
+class LatencyHistogram:
+    # Log-spaced buckets over a sliding window of the most recent calls.
+    def __init__(self, window: int = 500, min_seconds: float = 1e-3, growth: float = 1.2, n_buckets: int = 80):
+        self.min_seconds = min_seconds
+        self.growth = growth
+        self.counts = [0] * n_buckets
+        self.samples: deque[int] = deque()
+        self.window = window
+        self._lock = threading.Lock()
+
+    def _bucket(self, seconds: float) -> int:
+        if seconds <= self.min_seconds:
+            return 0
+        return min(len(self.counts) - 1, 1 + int(math.log(seconds / self.min_seconds, self.growth)))
+
+    def add(self, seconds: float) -> None:
+        bucket = self._bucket(seconds)
+        with self._lock:
+            self.samples.append(bucket)
+            self.counts[bucket] += 1
+            if len(self.samples) > self.window:
+                self.counts[self.samples.popleft()] -= 1
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def percentile(self, p: float) -> float:
+        with self._lock:
+            target = max(1, math.ceil(p * len(self.samples)))
+            seen = 0
+            for bucket, count in enumerate(self.counts):
+                seen += count
+                if seen >= target:
+                    # Upper bound of the bucket, so the threshold errs on the late side.
+                    return self.min_seconds * self.growth ** bucket
+        return math.inf
+
+
+class Cancellation:
+    def __init__(self):
+        self.cancelled = False
+        self._callbacks: list[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def add_callback(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+class Hedger:
+    # A call still running at the configured percentile of its endpoint's recent latencies gets a duplicate, the
+    # first one to succeed wins and the other is cancelled (or abandoned when it can't be interrupted).
+    def __init__(self, cfg: HedgeCfg = HedgeCfg()):
+        self.cfg = cfg
+        self.histograms: dict[str, LatencyHistogram] = {}
+        self.counters: dict[str, dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._executor: ThreadPoolExecutor | None = None
+
+    def _endpoint(self, endpoint: str) -> tuple[LatencyHistogram, dict[str, int]]:
+        with self._lock:
+            if endpoint not in self.histograms:
+                self.histograms[endpoint] = LatencyHistogram(window=self.cfg.window)
+                self.counters[endpoint] = {"calls": 0, "hedges": 0, "hedge_wins": 0}
+            return self.histograms[endpoint], self.counters[endpoint]
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.cfg.max_workers, thread_name_prefix="hedge")
+            return self._executor
+
+    @staticmethod
+    def _timed(histogram: LatencyHistogram, attempt: Callable[[Cancellation], T], cancellation: Cancellation) -> T:
+        start = time.perf_counter()
+        out = attempt(cancellation)
+        # The losers are timed as well, leaving them out would hide the very tail that triggers the hedges.
+        histogram.add(time.perf_counter() - start)
+        return out
+
+    def _allow_hedge(self, counters: dict[str, int], before_hedge: Callable[[], bool] | None) -> bool:
+        # The extra requests are capped to a fraction of the calls, and the caller may veto them, e.g. out of quota.
+        with self._lock:
+            if counters["hedges"] + 1 > self.cfg.max_extra_fraction * counters["calls"]:
+                return False
+        if before_hedge is not None and not before_hedge():
+            return False
+        with self._lock:
+            counters["hedges"] += 1
+        return True
+
+    def call(self,
+             endpoint: str,
+             attempt: Callable[[Cancellation], T],
+             before_hedge: Callable[[], bool] | None = None) -> T:
+        histogram, counters = self._endpoint(endpoint)
+        with self._lock:
+            counters["calls"] += 1
+        if not self.cfg.enabled or len(histogram) < self.cfg.min_samples:
+            return self._timed(histogram, attempt, Cancellation())
+        threshold = histogram.percentile(self.cfg.percentile)
+        cancellation = Cancellation()
+        primary = self.executor.submit(propagate(self._timed), histogram, attempt, cancellation)
+        attempts: dict[Future, Cancellation] = {primary: cancellation}
+        done, _ = wait([primary], timeout=threshold)
+        if len(done) == 0 and self._allow_hedge(counters, before_hedge):
+            record(hedges=1)
+            cancellation = Cancellation()
+            attempts[self.executor.submit(propagate(self._timed), histogram, attempt, cancellation)] = cancellation
+        pending = set(attempts)
+        error: BaseException | None = None
+        while len(pending) > 0:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception() if error is None else error
+                    continue
+                for loser in pending:
+                    loser.cancel()
+                    attempts[loser].cancel()
+                if future is not primary:
+                    record(hedge_wins=1)
+                    with self._lock:
+                        counters["hedge_wins"] += 1
+                return future.result()
+        raise error
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            endpoints = list(self.histograms.items())
+        return {endpoint: {**self.counters[endpoint],
+                           "p50_seconds": histogram.percentile(0.5),
+                           "p95_seconds": histogram.percentile(0.95)}
+                for endpoint, histogram in endpoints if len(histogram) > 0}
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_hedge_cfg = HedgeCfg()
+_hedger: Hedger | None = None
+_hedger_lock = threading.Lock()
+
+
+def configure_hedging(cfg: HedgeCfg) -> None:
+    global _hedge_cfg, _hedger
+    with _hedger_lock:
+        _hedge_cfg = cfg
+        if _hedger is not None:
+            _hedger.shutdown()
+        _hedger = None
+
+
+def get_hedger() -> Hedger:
+    global _hedger
+    with _hedger_lock:
+        if _hedger is None:
+            _hedger = Hedger(cfg=_hedge_cfg)
+        return _hedger
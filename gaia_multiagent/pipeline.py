@@ -1,24 +1,42 @@
+import threading
 from importlib import resources
+from typing import Callable
 
-import pandas as pd
 from smolagents import CodeAgent
+from smolagents.memory import ActionStep
 
 from gaia_multiagent import prompts
 from gaia_multiagent.api_interaction import Task, TaskType
-from gaia_multiagent.engines import GeminiEngine, GeminiVerifier
+from gaia_multiagent.cache import CacheMode, get_cache_cfg
+from gaia_multiagent.engines import GeminiEngine, GeminiVerifier, get_file_registry
+from gaia_multiagent.results import TaskCheckpoint
 from gaia_multiagent.tools.files import ImageQA, AudioQA
+from gaia_multiagent.tools.memory import RecallObservation
 from gaia_multiagent.tools.search import WebSearchAssistant
 from gaia_multiagent.utils import InternetSearch, load_as_txt
+from gaia_multiagent.verification import normalize_answer
 
 
 def multiagent_pipeline(task: Task,
                         engine_model_id: str = "gemini-2.0-flash",
-                        verifier_model_id: str = "gemini-2.5-flash-preview-04-17") -> tuple[str, dict]:
-    engine = GeminiEngine(model_id=engine_model_id)
+                        verifier_model_id: str = "gemini-2.5-flash-preview-04-17",
+                        timeout: float | None = None,
+                        checkpoint: TaskCheckpoint | None = None,
+                        engine: GeminiEngine | None = None,
+                        verifier: GeminiVerifier | None = None,
+                        search_engine: InternetSearch | None = None) -> tuple[str, dict]:
+    if (task.file_type in [TaskType.IMAGE, TaskType.AUDIO, TaskType.VIDEO]
+            and get_cache_cfg().response_mode != CacheMode.REPLAY):
+        # The upload runs in the background while the agents are being built.
+        get_file_registry().upload(task.filepath)
+    engine = engine if engine is not None else GeminiEngine(model_id=engine_model_id)
     question = task.description
     search_assistant_tool = WebSearchAssistant(engine=engine,
-                                               search_engine=InternetSearch())
+                                               search_engine=search_engine if search_engine is not None
+                                               else InternetSearch())
     tools = [search_assistant_tool]
+    if engine.compactor.cfg.enabled:
+        tools.append(RecallObservation())
     base_prompt = (f"Find the answer to the following question: {question}. \n"
                    "If you search on the web, don't use the same (or very similar) query twice. Don't search on the web"
                    " for trivial and well known common knowledge.\n"
@@ -34,19 +52,59 @@ def multiagent_pipeline(task: Task,
     if task.file_type == TaskType.TEXTFILE:
         file_content = load_as_txt(filepath=task.filepath)
         base_prompt += f"You can use the provided file {task.filepath} whose content is reported below:\n{file_content}"
-    verifier = GeminiVerifier(model_id=verifier_model_id)
+    verifier = verifier if verifier is not None else GeminiVerifier(model_id=verifier_model_id)
     manager_agent = CodeAgent(model=engine,
                                tools=tools,
                                planning_interval=3,
                                verbosity_level=2,
-                               final_answer_checks=[verifier.verify],
+                               final_answer_checks=[answer_check(verifier, question)],
                                additional_authorized_imports=["pandas"],
+                               step_callbacks=[checkpoint] if checkpoint is not None else None,
                                max_steps=15)
+    restored = checkpoint.restored_steps() if checkpoint is not None else []
+    if len(restored) > 0:
+        print(f"Resuming task {task.task_id} from {len(restored)} checkpointed steps.")
+        # The step counter restarts from 1 on a resumed run, the remaining budget is what is left of max_steps.
+        manager_agent.max_steps = max(1, manager_agent.max_steps - sum(isinstance(s, ActionStep) for s in restored))
     manager_agent.prompt_templates["planning"]["initial_plan"] = resources.read_text(prompts, "initial_planning.txt")
     print("Starting execution...")
-    ans = manager_agent.run(base_prompt)
-    engine.clear_all_files()
+    timer = None
+    if timeout is not None:
+        # Agents can only be stopped between steps, so this is a soft deadline.
+        timer = threading.Timer(timeout, _interrupt, args=(manager_agent, search_assistant_tool.agent))
+        timer.daemon = True
+        timer.start()
+    try:
+        if len(restored) == 0:
+            ans = manager_agent.run(base_prompt)
+        else:
+            # run() appends the TaskStep before the first step is executed, the checkpointed steps go right after it.
+            steps = manager_agent.run(base_prompt, stream=True)
+            manager_agent.memory.steps.extend(restored)
+            last = None
+            for last in steps:
+                pass
+            ans = _final_output(last)
+    finally:
+        if timer is not None:
+            timer.cancel()
+    if isinstance(ans, str):
+        ans = normalize_answer(ans)
     return ans, manager_agent.memory.get_succinct_steps()
 
 
+def answer_check(verifier: GeminiVerifier, question: str) -> Callable[..., str]:
+    # smolagents names the failed check in the feedback to the agent, and recent versions also pass the agent itself.
+    def verify_answer(final_answer: str, agent_memory: any, agent: CodeAgent | None = None) -> str:
+        return verifier.verify(final_answer, agent_memory, question=question)
+    return verify_answer
 
+
+def _final_output(step) -> str | None:
+    # The final step holds the answer in `output` or, in older smolagents versions, in `final_answer`.
+    return getattr(step, "output", getattr(step, "final_answer", None))
+
+
+def _interrupt(*agents: CodeAgent) -> None:
+    for agent in agents:
+        agent.interrupt()
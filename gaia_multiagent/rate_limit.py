@@ -0,0 +1,148 @@
+import random
+import re
+import threading
+import time
+
+from tenacity import RetryCallState
+
+
+class TokenBucket:
+    def __init__(self, per_minute: int):
+        if per_minute < 1:
+            raise ValueError(f"The bucket size must be positive, got {per_minute}")
+        self.capacity = per_minute
+        self.rate = per_minute / 60.
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def available(self, now: float) -> float:
+        return min(self.capacity, self.level + (now - self.updated) * self.rate)
+
+    def reserve(self, amount: float, now: float) -> float:
+        # The level may go negative: later callers queue behind the debt, which keeps the bucket fair.
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate) - amount
+        self.updated = now
+        return max(0., -self.level / self.rate)
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute: int | None = None, tokens_per_minute: int | None = None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute is not None else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute is not None else None
+        self.blocked_until = 0.
+        self.calls = 0
+        self.throttled_seconds = 0.
+        self.generating_seconds = 0.
+        self.server_delays = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int = 0) -> float:
+        with self._lock:
+            now = time.monotonic()
+            delay = max(0., self.blocked_until - now)
+            if self.requests is not None:
+                delay = max(delay, self.requests.reserve(1, now))
+            if self.tokens is not None:
+                delay = max(delay, self.tokens.reserve(min(tokens, self.tokens.capacity), now))
+            self.throttled_seconds += delay
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def try_acquire(self, tokens: int = 0) -> bool:
+        # Optional requests (hedges) only go out when the budget has room right now, they never queue.
+        with self._lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return False
+            if self.requests is not None and self.requests.available(now) < 1:
+                return False
+            if self.tokens is not None and self.tokens.available(now) < min(tokens, self.tokens.capacity):
+                return False
+            if self.requests is not None:
+                self.requests.reserve(1, now)
+            if self.tokens is not None:
+                self.tokens.reserve(min(tokens, self.tokens.capacity), now)
+            return True
+
+    def record(self, seconds: float, tokens: int = 0, estimate: int = 0) -> None:
+        with self._lock:
+            self.calls += 1
+            self.generating_seconds += seconds
+            if self.tokens is not None:
+                self.tokens.level -= tokens - estimate
+
+    def block(self, seconds: float) -> None:
+        # The server asked to back off, every caller of this model waits instead of hitting the same 429.
+        with self._lock:
+            self.server_delays += 1
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def stats(self) -> dict[str, float]:
+        return {"calls": self.calls,
+                "throttled_seconds": self.throttled_seconds,
+                "generating_seconds": self.generating_seconds,
+                "server_delays": self.server_delays}
+
+
+_limiters: dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def set_rate_limit(model_id: str, requests_per_minute: int | None, tokens_per_minute: int | None = None) -> None:
+    with _limiters_lock:
+        _limiters[model_id] = RateLimiter(requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute)
+
+
+def get_rate_limiter(model_id: str) -> RateLimiter:
+    with _limiters_lock:
+        if model_id not in _limiters:
+            _limiters[model_id] = RateLimiter()
+        return _limiters[model_id]
+
+
+def rate_limit_stats() -> dict[str, dict[str, float]]:
+    with _limiters_lock:
+        return {model_id: limiter.stats() for model_id, limiter in _limiters.items()}
+
+
+def retry_delay(error: BaseException) -> float | None:
+    # Gemini reports the delay in a RetryInfo detail ("retryDelay": "17s"), plain HTTP errors in Retry-After.
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        for detail in details.get("error", {}).get("details", []):
+            match = re.fullmatch(r"([\d.]+)s", str(detail.get("retryDelay", "")))
+            if match is not None:
+                return float(match.group(1))
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_transient(error: BaseException) -> bool:
+    # Only quota errors, server errors and dropped connections are retried, anything else would fail again.
+    import httpx
+    import requests
+    from google.genai import errors
+    if isinstance(error, errors.APIError):
+        return isinstance(error.code, int) and (error.code == 429 or error.code >= 500)
+    return isinstance(error, (TimeoutError, ConnectionError, requests.ConnectionError, requests.Timeout,
+                              httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError))
+
+
+class GeminiBackoff:
+    # Quick exponential backoff with jitter, unless the server says how long to wait.
+    def __init__(self, initial: float = 1., maximum: float = 60.):
+        self.initial = initial
+        self.maximum = maximum
+
+    def __call__(self, retry_state: RetryCallState) -> float:
+        error = retry_state.outcome.exception()
+        delay = retry_delay(error)
+        if delay is not None:
+            get_rate_limiter(retry_state.args[0].model_id).block(delay)
+            return delay
+        backoff = min(self.maximum, self.initial * 2 ** (retry_state.attempt_number - 1))
+        return backoff * random.uniform(0.5, 1.)
@@ -0,0 +1,171 @@
+import csv
+import io
+import json
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+
+from smolagents.memory import TaskStep
+from smolagents.utils import AgentError
+
+
+def _restore_error(cls: type[AgentError], message: str) -> AgentError:
+    error = cls.__new__(cls)
+    Exception.__init__(error, message)
+    error.message = message
+    return error
+
+
+class _StepPickler(pickle.Pickler):
+    # AgentError.__init__ requires a logger, so the default pickling of a step holding an error can't be loaded back.
+    def reducer_override(self, obj):
+        if isinstance(obj, AgentError):
+            return _restore_error, (type(obj), str(obj.message))
+        return NotImplemented
+
+
+def dump_step(step) -> bytes:
+    buffer = io.BytesIO()
+    _StepPickler(buffer).dump(step)
+    return buffer.getvalue()
+
+
+class ResultStore:
+    # Append-only SQLite store: answers are indexed by task id and every worker process can write to it concurrently.
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._local = threading.local()
+        self._solved = {row[0] for row in self._conn.execute("SELECT task_id FROM results")}
+        self._lock = threading.Lock()
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30., isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS results (task_id TEXT PRIMARY KEY, submitted_answer TEXT, "
+                         "steps TEXT, created REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS checkpoints (task_id TEXT, step INTEGER, value BLOB, "
+                         "PRIMARY KEY (task_id, step))")
+            conn.execute("CREATE TABLE IF NOT EXISTS imports (path TEXT PRIMARY KEY, created REAL)")
+            self._local.conn = conn
+        return conn
+
+    def is_solved(self, task_id: str) -> bool:
+        with self._lock:
+            if task_id in self._solved:
+                return True
+        # Another process may have solved it since the store was opened.
+        found = self._conn.execute("SELECT 1 FROM results WHERE task_id = ?", (task_id,)).fetchone() is not None
+        if found:
+            with self._lock:
+                self._solved.add(task_id)
+        return found
+
+    def add(self, task_id: str, answer: str, steps: list) -> None:
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?)",
+                     (task_id, str(answer), json.dumps(steps, default=str), time.time()))
+        conn.execute("DELETE FROM checkpoints WHERE task_id = ?", (task_id,))
+        conn.execute("COMMIT")
+        with self._lock:
+            self._solved.add(task_id)
+
+    def answer(self, task_id: str) -> str | None:
+        row = self._conn.execute("SELECT submitted_answer FROM results WHERE task_id = ?", (task_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def save_step(self, task_id: str, index: int, step) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?)", (task_id, index, dump_step(step)))
+
+    def load_steps(self, task_id: str) -> list:
+        steps = []
+        rows = self._conn.execute("SELECT step, value FROM checkpoints WHERE task_id = ? ORDER BY step", (task_id,))
+        for index, value in rows:
+            if index != len(steps):
+                break
+            try:
+                steps.append(pickle.loads(value))
+            except Exception as e:
+                print(f"Discarding the checkpoint of task {task_id} from step {index}: {e}")
+                break
+        return steps
+
+    def import_csv(self, csv_path: str) -> int:
+        # Answers saved by the CSV runner of earlier versions, imported once so that their tasks are skipped.
+        path = os.path.abspath(csv_path)
+        csv.field_size_limit(sys.maxsize)
+        with open(csv_path, newline="") as f:
+            rows = [(r["task_id"], r["submitted_answer"], r.get("steps", "[]"), time.time()) for r in csv.DictReader(f)]
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        if conn.execute("SELECT 1 FROM imports WHERE path = ?", (path,)).fetchone() is not None:
+            conn.execute("COMMIT")
+            return 0
+        before = conn.total_changes
+        conn.executemany("INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?)", rows)
+        imported = conn.total_changes - before
+        conn.execute("INSERT INTO imports VALUES (?, ?)", (path, time.time()))
+        conn.execute("COMMIT")
+        with self._lock:
+            self._solved.update(r[0] for r in rows)
+        return imported
+
+    def export_csv(self, csv_path: str) -> int:
+        rows = self._conn.execute("SELECT task_id, submitted_answer, steps FROM results ORDER BY created").fetchall()
+        with open(csv_path + ".tmp", "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["task_id", "submitted_answer", "steps"])
+            writer.writerows(rows)
+        os.replace(csv_path + ".tmp", csv_path)
+        return len(rows)
+
+
+class TaskCheckpoint:
+    # Step callback of the manager agent, it persists every new memory step so that a crashed task resumes from there.
+    def __init__(self, store: ResultStore, task_id: str):
+        self.store = store
+        self.task_id = task_id
+        self.steps = store.load_steps(task_id)
+        self._saved = {id(step) for step in self.steps}
+
+    def restored_steps(self) -> list:
+        # The resumed run starts with a TaskStep of its own, the steps that followed the original one are replayed.
+        return [step for step in self.steps if not isinstance(step, TaskStep)]
+
+    def __call__(self, step, agent=None) -> None:
+        new_steps = agent.memory.steps if agent is not None else [step]
+        has_task = any(isinstance(s, TaskStep) for s in self.steps)
+        for s in new_steps:
+            if id(s) in self._saved:
+                continue
+            if isinstance(s, TaskStep) and has_task:
+                # The TaskStep of a resumed run, the checkpoint already starts with the original one.
+                self._saved.add(id(s))
+                continue
+            try:
+                self.store.save_step(self.task_id, len(self.steps), s)
+            except Exception as e:
+                print(f"Could not checkpoint a step of task {self.task_id}: {e}")
+                return
+            self._saved.add(id(s))
+            self.steps.append(s)
+
+
+_stores: dict[str, ResultStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_result_store(path: str) -> ResultStore:
+    path = os.path.abspath(path)
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = ResultStore(path)
+        return _stores[path]
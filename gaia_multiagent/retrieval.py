@@ -0,0 +1,92 @@
+import threading
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from gaia_multiagent.embeddings import text_hash
+from gaia_multiagent.tracing import traced
+
+
+class TaskVectorIndex:
+    # Grows with every search of a task, exact search stays cheaper than an ANN index until the index gets large.
+    def __init__(self, embeddings: Embeddings, ann_threshold: int = 20_000, hnsw_neighbors: int = 32):
+        self.embeddings = embeddings
+        self.ann_threshold = ann_threshold
+        self.hnsw_neighbors = hnsw_neighbors
+        self.documents: list[Document] = []
+        self.build_timings: list[dict[str, float]] = []
+        self.query_timings: list[dict[str, float]] = []
+        self._hashes: set[str] = set()
+        self._vectors: np.ndarray | None = None
+        self._norms: np.ndarray | None = None
+        self._ann = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    @traced("index.build")
+    def add_documents(self, documents: list[Document]) -> dict[str, float]:
+        start = time.perf_counter()
+        new = {}
+        for d in documents:
+            h = text_hash(d.page_content)
+            if h not in self._hashes and h not in new:
+                new[h] = d
+        vectors = None
+        if len(new) > 0:
+            vectors = np.asarray(self.embeddings.embed_documents([d.page_content for d in new.values()]),
+                                 dtype=np.float32)
+        embedded = time.perf_counter()
+        with self._lock:
+            if vectors is not None:
+                self._hashes.update(new.keys())
+                self.documents.extend(new.values())
+                norms = np.einsum("ij,ij->i", vectors, vectors)
+                self._vectors = vectors if self._vectors is None else np.concatenate([self._vectors, vectors])
+                self._norms = norms if self._norms is None else np.concatenate([self._norms, norms])
+            if len(self.documents) >= self.ann_threshold:
+                self._extend_ann()
+        timing = {"new_chunks": len(new),
+                  "duplicate_chunks": len(documents) - len(new),
+                  "embedding_seconds": embedded - start,
+                  "build_seconds": time.perf_counter() - embedded}
+        self.build_timings.append(timing)
+        return timing
+
+    def _extend_ann(self) -> None:
+        import faiss
+        if self._ann is None:
+            self._ann = faiss.IndexHNSWFlat(self._vectors.shape[1], self.hnsw_neighbors)
+        self._ann.add(self._vectors[self._ann.ntotal:])
+
+    @traced("index.query")
+    def similarity_search(self, query: str, k: int) -> list[Document]:
+        start = time.perf_counter()
+        q = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        embedded = time.perf_counter()
+        with self._lock:
+            if self._vectors is None:
+                self.query_timings.append({"query_embedding_seconds": embedded - start,
+                                           "query_seconds": 0.,
+                                           "index_size": 0,
+                                           "ann": 0.})
+                return []
+            k = min(k, len(self.documents))
+            if self._ann is not None:
+                _, ids = self._ann.search(q[None, :], k)
+                ids = [i for i in ids[0] if i >= 0]
+            else:
+                # Squared L2 distance up to the query norm, the same ranking as the FAISS flat index.
+                distances = self._norms - 2 * self._vectors @ q
+                ids = np.argpartition(distances, k - 1)[:k]
+                ids = ids[np.argsort(distances[ids])]
+            results = [self.documents[i] for i in ids]
+        timing = {"query_embedding_seconds": embedded - start,
+                  "query_seconds": time.perf_counter() - embedded,
+                  "index_size": len(self.documents),
+                  "ann": float(self._ann is not None)}
+        self.query_timings.append(timing)
+        return results
@@ -2,6 +2,7 @@ from smolagents import Tool
 
 from gaia_multiagent.cfg import GenerationCfg
 from gaia_multiagent.engines import GeminiFileQA
+from gaia_multiagent.tracing import traced
 
 
 class FileQA(Tool):
@@ -18,6 +19,7 @@ class FileQA(Tool):
         self.cfg = cfg
         self.engine = GeminiFileQA(model_id=model_id, cfg=cfg, filepath=filepath)
 
+    @traced("tool.FileQA")
     def forward(self, question: str) -> str:
         prompt = self.task_prompt.format(question=question)
         ans = self.engine(prompt)
@@ -0,0 +1,29 @@
+from smolagents import Tool
+
+from gaia_multiagent.compaction import ObservationStore, get_observation_store
+from gaia_multiagent.tracing import traced
+
+
+class RecallObservation(Tool):
+    name = "RecallObservation"
+    description = ("Long observations of earlier steps are shortened in the history to save space. This tool returns "
+                   "the full text of a shortened observation given its id, e.g. 'obs-1a2b3c4d5e'.")
+    inputs = {
+        "observation_id": {
+            "type": "string",
+            "description": "The id reported where the observation was shortened.",
+        }
+    }
+
+    output_type = "string"
+
+    def __init__(self, store: ObservationStore | None = None):
+        super().__init__()
+        self.store = store if store is not None else get_observation_store()
+
+    @traced("tool.RecallObservation")
+    def forward(self, observation_id: str) -> str:
+        text = self.store.get(observation_id.strip())
+        if text is None:
+            return f"No observation with id {observation_id}, the ids look like 'obs-1a2b3c4d5e'."
+        return text
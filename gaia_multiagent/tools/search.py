@@ -1,16 +1,25 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
 from importlib import resources
+from typing import Callable
 
-from langchain_community.vectorstores import FAISS
+import numpy as np
 from langchain_core.documents import Document
-from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from smolagents import Tool, CodeAgent
 
 from gaia_multiagent import prompts
-from gaia_multiagent.cfg import RetrieverCfg, SearchAssistantCfg
+from gaia_multiagent.cache import CachedPageVisit
+from gaia_multiagent.cfg import PageReaderCfg, RetrieverCfg, SearchAssistantCfg
+from gaia_multiagent.embeddings import CachedEmbeddings, EmbeddingCache, get_embeddings
 from gaia_multiagent.engines import GeminiEngine
+from gaia_multiagent.retrieval import TaskVectorIndex
+from gaia_multiagent.tools.memory import RecallObservation
 from gaia_multiagent.tools.youtube import YouTubeQA
-from gaia_multiagent.utils import PlaywrightPageVisit, InternetSearch
+from gaia_multiagent.tracing import propagate, traced
+from gaia_multiagent.utils import InternetSearch, TieredPageVisit
 
 
 class WebResultsRAG(Tool):
@@ -29,11 +38,10 @@ class WebResultsRAG(Tool):
 
     def __init__(self,
                  websearch_engine: InternetSearch,
-                 embeddings: HuggingFaceEmbeddings,
+                 index: TaskVectorIndex,
                  cfg: RetrieverCfg = RetrieverCfg()):
         super().__init__()
-        self.visit_tool = PlaywrightPageVisit()
-        self.embeddings = embeddings
+        self.index = index
         self.websearch_engine = websearch_engine
         self.splitter = RecursiveCharacterTextSplitter(chunk_size=cfg.chunk_size,
                                                        chunk_overlap=cfg.chunk_overlap,
@@ -49,14 +57,13 @@ class WebResultsRAG(Tool):
                 documents.append(Document(page_content=s, metadata={"source": result.source}))
         return documents
 
-    def get_results_vectorstore(self, query: str) -> FAISS:
-        documents = self.get_search_documents(query)
-        vector_store = FAISS.from_documents(documents=documents, embedding=self.embeddings)
-        return vector_store
-
+    @traced("tool.WebSearchRAG")
     def forward(self, query: str) -> str:
-        vectorstore = self.get_results_vectorstore(query=query)
-        results = vectorstore.similarity_search(query=query, k=self.cfg.k)
+        build = self.index.add_documents(self.get_search_documents(query))
+        results = self.index.similarity_search(query=query, k=self.cfg.k)
+        print(f"Index: {len(self.index)} chunks, {build['new_chunks']} new, built in "
+              f"{build['embedding_seconds'] + build['build_seconds']:.2f}s, "
+              f"queried in {self.index.query_timings[-1]['query_seconds'] * 1000:.1f}ms")
         sources_data = {}
         for r in results:
             source = r.metadata['source']
@@ -95,13 +102,18 @@ class WebSearch(Tool):
                  cfg: RetrieverCfg = RetrieverCfg()):
         super().__init__()
         self.websearch_engine = websearch_engine
-        self.embeddings = HuggingFaceEmbeddings(model_name=embedding_model)
+        self.embeddings = CachedEmbeddings(get_embeddings(embedding_model),
+                                           cache=EmbeddingCache(model_name=embedding_model))
+        self.index = TaskVectorIndex(embeddings=self.embeddings)
         self.cfg = cfg
         self.engine = engine
 
+    @traced("tool.WebSearch")
     def forward(self, query: str) -> str:
-        web_rag_tool = WebResultsRAG(websearch_engine=self.websearch_engine, embeddings=self.embeddings, cfg=self.cfg)
-        agent = CodeAgent(model=self.engine, max_steps=3, tools=[web_rag_tool], verbosity_level=0)
+        tools = [WebResultsRAG(websearch_engine=self.websearch_engine, index=self.index, cfg=self.cfg)]
+        if self.engine.compactor.cfg.enabled:
+            tools.append(RecallObservation())
+        agent = CodeAgent(model=self.engine, max_steps=3, tools=tools, verbosity_level=0)
         refined_task = (f"Provide information about the following task: '{query}'. "
                         f"Provide a small summary of what you found."
                         f" Always cite sources urls from which you got each pieace of information.")
@@ -130,21 +142,125 @@ class WebPageRetriever(Tool):
 
     def __init__(self,
                  engine: GeminiEngine,
-                 system_prompt: str = resources.read_text(prompts, "page_retriever.txt"),
+                 system_prompt: str | None = None,
+                 visit_tool: Callable[[str], str] | None = None,
+                 embeddings: Embeddings | None = None,
+                 cfg: PageReaderCfg = PageReaderCfg(),
                  ):
         super().__init__()
         self.engine = engine
-        self.visit_tool = PlaywrightPageVisit()
+        self.visit_tool = visit_tool if visit_tool is not None else CachedPageVisit(TieredPageVisit())
+        if system_prompt is None:
+            system_prompt = resources.read_text(prompts, "page_retriever.txt")
         self.system_prompt = system_prompt
+        self.cfg = cfg
+        if embeddings is not None:
+            self.embeddings = embeddings
+        self.splitter = RecursiveCharacterTextSplitter(chunk_size=cfg.chunk_size, chunk_overlap=cfg.chunk_overlap)
+        self.timings: list[dict[str, float]] = []
+
+    @cached_property
+    def embeddings(self) -> Embeddings:
+        return CachedEmbeddings(get_embeddings(self.cfg.embedding_model),
+                                cache=EmbeddingCache(model_name=self.cfg.embedding_model))
+
+    def tokens(self, text: str) -> int:
+        return len(text) // self.cfg.chars_per_token
+
+    def ask(self, context: str, request: str) -> str:
+        messages = [{"role": "system", "content": [{"text": self.system_prompt}]},
+                    {"role": "user", "content": [{"text": context + request}]}]
+        return self.engine(messages).content
 
+    def rank_chunks(self, task: str, chunks: list[str]) -> np.ndarray:
+        vectors = np.asarray(self.embeddings.embed_documents(chunks), dtype=np.float32)
+        query = np.asarray(self.embeddings.embed_query(task), dtype=np.float32)
+        return vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query) + 1e-12)
+
+    def top_chunks(self, task: str, page_content: str) -> str:
+        chunks = self.splitter.split_text(page_content)
+        scores = self.rank_chunks(task, chunks)
+        budget = self.cfg.max_page_tokens
+        keep = []
+        for i in np.argsort(scores)[::-1]:
+            if self.tokens(chunks[i]) <= budget:
+                budget -= self.tokens(chunks[i])
+                keep.append(i)
+        # Passages are reported in page order, which keeps lists and tables readable.
+        return "\n[...]\n".join(chunks[i] for i in sorted(keep))
+
+    def top_sections(self, task: str, page_content: str) -> list[str]:
+        # Adjacent chunks are grouped in sections within the token budget, the most relevant sections are kept.
+        chunks = self.splitter.split_text(page_content)
+        scores = self.rank_chunks(task, chunks)
+        sections: list[list[str]] = [[]]
+        section_scores = [-np.inf]
+        section_tokens = 0
+        for chunk, score in zip(chunks, scores):
+            if len(sections[-1]) > 0 and section_tokens + self.tokens(chunk) > self.cfg.max_page_tokens:
+                sections.append([])
+                section_scores.append(-np.inf)
+                section_tokens = 0
+            sections[-1].append(chunk)
+            section_scores[-1] = max(section_scores[-1], score)
+            section_tokens += self.tokens(chunk)
+        best = sorted(np.argsort(section_scores)[::-1][:self.cfg.max_map_sections])
+        return ["\n".join(sections[i]) for i in best]
+
+    def fit_extracts(self, extracts: list[str]) -> list[str]:
+        # The reduce prompt stays within the page budget: short extracts are kept whole, the longer ones share what is
+        # left of it equally and are cut.
+        marker = "\n[...]"
+        budget = self.cfg.max_page_tokens * self.cfg.chars_per_token - len(extracts) * len("<extract></extract>\n")
+        fitted = list(extracts)
+        by_length = sorted(range(len(fitted)), key=lambda i: len(fitted[i]))
+        for n, i in enumerate(by_length):
+            share = max(0, budget) // (len(by_length) - n)
+            if len(fitted[i]) > share:
+                fitted[i] = fitted[i][:max(0, share - len(marker))] + marker if share >= len(marker) else ""
+            budget -= len(fitted[i])
+        return fitted
+
+    @traced("tool.WebPageRetriever")
     def forward(self, task: str, url: str) -> str:
+        start = time.perf_counter()
         page_content = self.visit_tool(url)
-        context = f"<page>{page_content}</page>\n"
         request = f"Find and summarize information in the Webpage related to: '{task}'."
-        messages = [{"role": "system", "content": [{"text": self.system_prompt}]},
-                    {"role": "user", "content": [{"text": context + request}]}]
-        out = self.engine(messages)
-        return out.content
+        page_tokens = self.tokens(page_content)
+        if page_tokens <= self.cfg.max_page_tokens:
+            mode, calls, prompt_tokens = "single", 1, page_tokens
+            out = self.ask(f"<page>{page_content}</page>\n", request)
+        elif page_tokens <= self.cfg.map_reduce_tokens:
+            mode, calls = "chunked", 1
+            passages = self.top_chunks(task, page_content)
+            prompt_tokens = self.tokens(passages)
+            out = self.ask(f"<page>{passages}</page>\n", request)
+        else:
+            mode = "map_reduce"
+            sections = self.top_sections(task, page_content)
+            with ThreadPoolExecutor(max_workers=self.cfg.map_workers) as executor:
+                read = propagate(lambda s: self.ask(f"<page>{s}</page>\n", request))
+                extracts = list(executor.map(read, sections))
+            context = "".join(f"<extract>{e}</extract>\n" for e in self.fit_extracts(extracts))
+            out = self.ask(context, f"The extracts come from different sections of the same webpage. "
+                                    f"Combine them in a single summary of the information related to: '{task}'.")
+            calls = len(sections) + 1
+            prompt_tokens = sum(self.tokens(s) for s in sections) + self.tokens(context)
+        timing = {"mode": mode, "page_tokens": page_tokens, "prompt_tokens": prompt_tokens, "calls": calls,
+                  "seconds": time.perf_counter() - start}
+        self.timings.append(timing)
+        print(f"Read {url} in {mode} mode: {page_tokens} page tokens, {prompt_tokens} prompt tokens, {calls} calls, "
+              f"{timing['seconds']:.2f}s")
+        return out
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        out = {}
+        for timing in self.timings:
+            mode = out.setdefault(timing["mode"], {"pages": 0, "page_tokens": 0, "prompt_tokens": 0, "seconds": 0.})
+            mode["pages"] += 1
+            for k in ["page_tokens", "prompt_tokens", "seconds"]:
+                mode[k] += timing[k]
+        return out
 
 
 # PROBABLY TOO MUCH OVERHEAD
@@ -184,16 +300,22 @@ class WebSearchAssistant(Tool):
                                          embedding_model=self.cfg.embedding_model,
                                          websearch_engine=search_engine,
                                          cfg=self.cfg.retriever_cfg)
-        self.web_page_tool = WebPageRetriever(engine=engine)
+        self.web_page_tool = WebPageRetriever(engine=engine,
+                                              visit_tool=search_engine.visit_tool,
+                                              embeddings=self.web_search_tool.embeddings)
         self.youtube_tool = YouTubeQA(model_id=engine.model_id, output_dir=download_folder)
+        tools = [self.web_search_tool, self.web_page_tool, self.youtube_tool]
+        if engine.compactor.cfg.enabled:
+            tools.append(RecallObservation())
         self.agent = CodeAgent(model=engine,
-                               tools=[self.web_search_tool, self.web_page_tool, self.youtube_tool],
+                               tools=tools,
                                # with web_rag_tools it works
                                planning_interval=self.cfg.planning_interval,
                                verbosity_level=self.cfg.verbosity_level,
                                max_steps=self.cfg.max_steps)
         self.agent.prompt_templates["planning"]["initial_plan"] = resources.read_text(prompts, "initial_planning.txt")
 
+    @traced("tool.WebSearchAssistant")
     def forward(self, assignment: str) -> str:
         prompt = self.task_prompt.format(assignment=assignment)
         output = self.agent.run(prompt)
@@ -1,10 +1,43 @@
 import os
+import re
+import threading
+from urllib.parse import parse_qs, urlparse
 
-from pytubefix import YouTube
 from smolagents import Tool
 
 from gaia_multiagent.cfg import GenerationCfg
-from gaia_multiagent.tools.files import FileQA, VideoQA
+from gaia_multiagent.tools.files import AudioQA, FileQA, VideoQA
+from gaia_multiagent.tracing import span, traced
+
+SPEECH_WORDS = {"say", "said", "says", "saying", "speak", "speaks", "spoke", "spoken", "speaking", "speaker", "hear",
+                "hears", "heard", "audio", "voice", "voices", "transcript", "transcribe", "quote", "quoted", "respond",
+                "responds", "responded", "response", "reply", "replies", "replied", "lyrics", "narrator", "narration",
+                "dialogue", "pronounce", "pronounced"}
+VISUAL_WORDS = {"see", "seen", "show", "shows", "shown", "look", "looks", "appear", "appears", "visible", "screen",
+                "sign", "signs", "written", "write", "writes", "text", "caption", "captions", "subtitle", "subtitles",
+                "read", "color", "colour", "wear", "wearing", "picture", "image", "frame", "scene", "camera", "on-screen"}
+
+
+def parse_video_id(url: str) -> str:
+    parts = urlparse(url.strip() if "//" in url else "https://" + url.strip())
+    host = parts.netloc.lower().split(":")[0].removeprefix("www.").removeprefix("m.")
+    video_id = ""
+    if host == "youtu.be":
+        video_id = parts.path.lstrip("/").split("/")[0]
+    elif host in ["youtube.com", "music.youtube.com", "youtube-nocookie.com"]:
+        if parts.path == "/watch":
+            video_id = parse_qs(parts.query).get("v", [""])[0]
+        elif (match := re.match(r"/(?:embed|shorts|live|v)/([^/?#]+)", parts.path)) is not None:
+            video_id = match.group(1)
+    if re.fullmatch(r"[\w-]{11}", video_id) is None:
+        raise ValueError(f"Can't find a YouTube video id in {url}")
+    return video_id
+
+
+def is_speech_question(question: str) -> bool:
+    # The audio track alone is only used when the question is clearly about what is said, in doubt the full video is.
+    words = set(re.findall(r"[\w-]+", question.lower()))
+    return len(words & SPEECH_WORDS) > 0 and len(words & VISUAL_WORDS) == 0
 
 
 class YouTubeQA(Tool):
@@ -28,19 +61,56 @@ class YouTubeQA(Tool):
 
     output_type = "string"
 
-    def __init__(self, model_id: str, output_dir: str, cfg: GenerationCfg = GenerationCfg()):
+    def __init__(self, model_id: str, output_dir: str, cfg: GenerationCfg = GenerationCfg(), min_resolution: int = 360):
         super().__init__()
         self.output_dir = output_dir
         self.cfg = cfg
         self.model_id = model_id
+        self.min_resolution = min_resolution
+        self._file_tools: dict[tuple[str, bool], FileQA] = {}
+        self._lock = threading.Lock()
+
+    def select_stream(self, streams, audio_only: bool):
+        if audio_only:
+            audio = streams.filter(only_audio=True, mime_type="audio/mp4").order_by("abr").asc()
+            if len(audio) > 0:
+                return audio.first()
+        # Progressive streams carry the audio track too, the smallest adequate one keeps download and upload short.
+        videos = list(streams.filter(progressive=True, file_extension="mp4").order_by("resolution").asc())
+        if len(videos) == 0:
+            return streams.first()
+        adequate = [s for s in videos if int(s.resolution.rstrip("p")) >= self.min_resolution]
+        return adequate[0] if len(adequate) > 0 else videos[-1]
 
-    def download_video(self, url: str) -> str:
+    def download_video(self, url: str, audio_only: bool = False) -> str:
+        from pytubefix import YouTube
         os.makedirs(self.output_dir, exist_ok=True)
-        filename = url.split('=')[1] + '.mp4'
-        YouTube(url).streams.first().download(output_path=self.output_dir, filename=filename)
-        return os.path.join(self.output_dir, filename)
+        video_id = parse_video_id(url)
+        filename = video_id + ('.m4a' if audio_only else '.mp4')
+        filepath = os.path.join(self.output_dir, filename)
+        if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
+            return filepath
+        with span("youtube.download", audio_only=audio_only):
+            stream = self.select_stream(YouTube(f"https://www.youtube.com/watch?v={video_id}").streams, audio_only)
+            # Written under a temporary name so that a partial download is never mistaken for a cached one.
+            stream.download(output_path=self.output_dir, filename=filename + ".part")
+        os.replace(filepath + ".part", filepath)
+        return filepath
+
+    def file_tool(self, url: str, audio_only: bool) -> FileQA:
+        with self._lock:
+            key = (parse_video_id(url), audio_only)
+            if key not in self._file_tools:
+                filepath = self.download_video(url=url, audio_only=audio_only)
+                tool_class = AudioQA if audio_only else VideoQA
+                self._file_tools[key] = tool_class(filepath=filepath, model_id=self.model_id, cfg=self.cfg)
+            return self._file_tools[key]
 
+    @traced("tool.YouTubeQA")
     def forward(self, question: str, url: str) -> str:
-        filepath = self.download_video(url=url)
-        fileqa = VideoQA(filepath=filepath, model_id=self.model_id, cfg=self.cfg)
-        return fileqa(question)
+        if is_speech_question(question):
+            try:
+                return self.file_tool(url, audio_only=True)(question)
+            except Exception as e:
+                print(f"Answering from the audio track of {url} failed, using the full video: {e}")
+        return self.file_tool(url, audio_only=False)(question)
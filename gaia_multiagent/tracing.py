@@ -0,0 +1,170 @@
+import contextvars
+import functools
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+from gaia_multiagent.cfg import TracingCfg
+
+
+class Span:
+    def __init__(self, name: str, attributes: dict[str, Any] | None = None):
+        self.name = name
+        self.attributes = attributes if attributes is not None else {}
+        self.counters: dict[str, float] = {}
+        self.children: list[Span] = []
+        self.start = time.time()
+        self.seconds = 0.
+        self.error: str | None = None
+        self._lock = threading.Lock()
+
+    def add(self, **counters: float) -> None:
+        with self._lock:
+            for k, v in counters.items():
+                self.counters[k] = self.counters.get(k, 0) + v
+
+    def add_child(self, span: "Span") -> None:
+        with self._lock:
+            self.children.append(span)
+
+    def walk(self) -> Iterator["Span"]:
+        yield self
+        for child in list(self.children):
+            yield from child.walk()
+
+    def to_dict(self) -> dict:
+        return {"name": self.name,
+                "start": self.start,
+                "seconds": self.seconds,
+                "attributes": self.attributes,
+                "counters": self.counters,
+                "error": self.error,
+                "children": [c.to_dict() for c in list(self.children)]}
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        # Totals per span name; nested spans of the same name are counted once so that recursion doesn't double time.
+        out: dict[str, dict[str, float]] = {}
+        self._summarize(out, active=frozenset())
+        return out
+
+    def _summarize(self, out: dict[str, dict[str, float]], active: frozenset[str]) -> None:
+        entry = out.setdefault(self.name, {"count": 0, "seconds": 0.})
+        entry["count"] += 1
+        if self.name not in active:
+            entry["seconds"] += self.seconds
+        for k, v in self.counters.items():
+            entry[k] = entry.get(k, 0) + v
+        for child in list(self.children):
+            child._summarize(out, active | {self.name})
+
+
+_current: contextvars.ContextVar[Span | None] = contextvars.ContextVar("gaia_span", default=None)
+_cfg = TracingCfg()
+_tracer = None
+
+
+def configure_tracing(cfg: TracingCfg) -> None:
+    global _cfg, _tracer
+    _cfg = cfg
+    _tracer = None
+
+
+def get_tracing_cfg() -> TracingCfg:
+    return _cfg
+
+
+def _otel_tracer():
+    global _tracer
+    if _tracer is None and _cfg.otel:
+        # Spans go to whatever tracer provider is set up, e.g. the one smolagents' telemetry extra instruments.
+        from opentelemetry import trace
+        _tracer = trace.get_tracer("gaia_multiagent")
+    return _tracer
+
+
+def current_span() -> Span | None:
+    return _current.get()
+
+
+def record(**counters: float) -> None:
+    span = _current.get()
+    if span is not None:
+        span.add(**counters)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    parent = _current.get()
+    s = Span(name, attributes)
+    if parent is not None:
+        parent.add_child(s)
+    token = _current.set(s)
+    otel = _otel_tracer()
+    otel_span = otel.start_as_current_span(name, attributes=attributes) if otel is not None else None
+    start = time.perf_counter()
+    try:
+        if otel_span is not None:
+            with otel_span as o:
+                try:
+                    yield s
+                finally:
+                    for k, v in s.counters.items():
+                        o.set_attribute(k, v)
+        else:
+            yield s
+    except BaseException as e:
+        s.error = repr(e)
+        raise
+    finally:
+        s.seconds = time.perf_counter() - start
+        _current.reset(token)
+
+
+def traced(name: str) -> Callable:
+    def decorator(f: Callable) -> Callable:
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def propagate(f: Callable) -> Callable:
+    # Worker threads don't inherit context variables, this carries the current span over to them.
+    context = contextvars.copy_context()
+
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(f, *args, **kwargs)
+    return wrapper
+
+
+def export_trace(root: Span, path: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"summary": root.summary(), "trace": root.to_dict()}, f)
+    os.replace(path + ".tmp", path)
+
+
+def hot_spots(trace_dir: str, task_ids: list[str] | None = None) -> list[tuple[str, dict[str, float]]]:
+    # Aggregates the per-task summaries of a batch, sorted by total time. The trace directory outlives the runs, the
+    # batch is selected by its task ids.
+    totals: dict[str, dict[str, float]] = {}
+    if task_ids is None:
+        paths = glob.glob(os.path.join(trace_dir, "*.json"))
+    else:
+        paths = [p for p in (os.path.join(trace_dir, f"{t}.json") for t in task_ids) if os.path.exists(p)]
+    for path in paths:
+        with open(path) as f:
+            summary = json.load(f)["summary"]
+        for name, entry in summary.items():
+            total = totals.setdefault(name, {"tasks": 0})
+            total["tasks"] += 1
+            for k, v in entry.items():
+                total[k] = total.get(k, 0) + v
+    return sorted(totals.items(), key=lambda item: item[1]["seconds"], reverse=True)
@@ -1,14 +1,25 @@
 import os
 import re
-from dataclasses import dataclass
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import asdict, dataclass
+from functools import cached_property
 from typing import Callable, Literal
+from urllib.parse import urlparse
 
-import pandas as pd
-from langchain_community.retrievers import WikipediaRetriever
-from playwright.sync_api import sync_playwright
-from markdownify import markdownify
+import requests
 from smolagents import DuckDuckGoSearchTool
 
+from gaia_multiagent.api_interaction import make_session
+from gaia_multiagent.browser import BrowserPool, get_browser_pool
+from gaia_multiagent.cache import (CachedPageVisit, CacheMissError, SearchCache, file_hash, get_cache_cfg,
+                                   get_search_cache)
+from gaia_multiagent.cfg import FetchCfg, TabularCfg
+from gaia_multiagent.extraction import html_to_markdown
+from gaia_multiagent.hedging import get_hedger
+from gaia_multiagent.tracing import propagate, record, span, traced
+
 
 @dataclass(frozen=True)
 class PageResult:
@@ -19,55 +30,275 @@ class PageResult:
 
 class PlaywrightPageVisit:
     def __init__(self,
-                 wait_until: Literal["commit", "domcontentloaded", "load", "networkidle"] | None = "load"):
+                 wait_until: Literal["commit", "domcontentloaded", "load", "networkidle"] | None = "load",
+                 pool: BrowserPool | None = None,
+                 timeout: float | None = None):
         self.wait_until = wait_until
+        self.pool = pool
+        self.timeout = timeout
+
+    @traced("fetch.browser")
+    def fetch_html(self, url: str) -> str:
+        pool = self.pool if self.pool is not None else get_browser_pool()
+        return get_hedger().call("fetch/browser",
+                                 lambda cancellation: pool.fetch(url, wait_until=self.wait_until, timeout=self.timeout,
+                                                                 cancellation=cancellation))
 
     def __call__(self, url: str) -> str:
+        return html_to_markdown(self.fetch_html(url))
+
+
+_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([\w.:-]+)""", re.I)
+
+
+def decode_html(content: bytes, content_type: str, fallback: Callable[[], str | None] = lambda: None) -> str:
+    # Without a charset requests decodes text as ISO-8859-1, the page's own declaration or a detected encoding are
+    # better guesses.
+    match = re.search(r"charset\s*=\s*[\"']?([\w.:-]+)", content_type, re.I)
+    declared = match.group(1) if match is not None else None
+    if declared is None and (match := _CHARSET_RE.search(content[:4096])) is not None:
+        declared = match.group(1).decode("ascii")
+    if declared is not None:
         try:
-            with sync_playwright() as p:
-                browser = p.chromium.launch(headless=True)
-                page = browser.new_page()
-                page.goto(url, wait_until=self.wait_until)
-                html = page.content()
-                markdown = markdownify(html)
-                browser.close()
-        except TimeoutError:
-            raise TimeoutError(f"Impossible to load the page {url}")
-        return markdown
+            return content.decode(declared)
+        except (LookupError, UnicodeDecodeError):
+            pass
+    try:
+        return content.decode(fallback() or "utf-8")
+    except (LookupError, UnicodeDecodeError):
+        return content.decode("utf-8", errors="replace")
+
+
+class HttpPageVisit:
+    def __init__(self, cfg: FetchCfg = FetchCfg()):
+        self.cfg = cfg
+
+    @cached_property
+    def session(self) -> requests.Session:
+        # No retries here, the browser tier is the fallback.
+        session = make_session(pool_size=self.cfg.pool_size, retries=0)
+        session.headers["User-Agent"] = self.cfg.user_agent
+        return session
+
+    @traced("fetch.http")
+    def fetch_html(self, url: str) -> str:
+        response = get_hedger().call("fetch/http", lambda cancellation: self.session.get(url,
+                                                                                         timeout=self.cfg.http_timeout))
+        response.raise_for_status()
+        content_type = response.headers.get("Content-Type", "text/html")
+        if "html" not in content_type and "text" not in content_type:
+            raise ValueError(f"Unsupported content type {content_type} for {url}")
+        return decode_html(response.content, content_type, fallback=lambda: response.apparent_encoding)
+
+    def __call__(self, url: str) -> str:
+        return html_to_markdown(self.fetch_html(url))
+
+
+_HIDDEN_RE = re.compile(r"<(script|style|noscript|template|svg)\b.*?</\1\s*>", re.S | re.I)
+_TAG_RE = re.compile(r"<[^>]+>")
+_NOSCRIPT_RE = re.compile(r"<noscript\b.*?</noscript\s*>", re.S | re.I)
+_JS_REQUIRED_RE = re.compile(r"enable javascript|javascript is (required|disabled)|requires javascript", re.I)
+
+
+def visible_text_length(html: str) -> int:
+    return len(" ".join(_TAG_RE.sub(" ", _HIDDEN_RE.sub(" ", html)).split()))
+
+
+def needs_browser(html: str, cfg: FetchCfg = FetchCfg()) -> bool:
+    # Server-rendered pages carry their text in the HTML, client-rendered ones ship an almost empty shell.
+    text_length = visible_text_length(html)
+    if text_length < cfg.min_text_chars:
+        return True
+    return (text_length < cfg.shell_text_chars
+            and any(_JS_REQUIRED_RE.search(n) for n in _NOSCRIPT_RE.findall(html)))
+
+
+class FetchTiers:
+    # Outcome of the HTTP tier for each domain, shared by all the fetchers of the process.
+    def __init__(self, browser_after: int = 2):
+        self.browser_after = browser_after
+        self.domains: dict[str, dict[str, int]] = {}
+        self.counts = {"http": 0, "browser": 0, "fallbacks": 0, "http_errors": 0}
+        self._lock = threading.Lock()
+
+    def prefers_browser(self, domain: str) -> bool:
+        # A single client-rendered page doesn't make its whole domain one.
+        with self._lock:
+            outcomes = self.domains.get(domain, {"http": 0, "fallbacks": 0})
+            return outcomes["fallbacks"] >= self.browser_after and outcomes["fallbacks"] > outcomes["http"]
+
+    def record(self, domain: str, tier: str, fallback: bool = False, http_error: bool = False) -> None:
+        with self._lock:
+            outcomes = self.domains.setdefault(domain, {"http": 0, "fallbacks": 0})
+            if tier == "http":
+                outcomes["http"] += 1
+            elif fallback and not http_error:
+                # Errors and non-HTML documents say nothing about how the domain renders its pages.
+                outcomes["fallbacks"] += 1
+            self.counts[tier] += 1
+            self.counts["fallbacks"] += int(fallback)
+            self.counts["http_errors"] += int(http_error)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            browser_domains = sum(o["fallbacks"] >= self.browser_after and o["fallbacks"] > o["http"]
+                                  for o in self.domains.values())
+        return self.counts | {"browser_domains": browser_domains}
+
+
+_fetch_tiers = FetchTiers()
+
+
+def get_fetch_tiers() -> FetchTiers:
+    return _fetch_tiers
+
+
+class TieredPageVisit:
+    # A plain GET first, the headless browser only for pages that need JavaScript to render their content.
+    def __init__(self,
+                 browser_visit: PlaywrightPageVisit | None = None,
+                 http_visit: HttpPageVisit | None = None,
+                 cfg: FetchCfg = FetchCfg(),
+                 tiers: FetchTiers | None = None):
+        self.browser_visit = browser_visit if browser_visit is not None else PlaywrightPageVisit()
+        self.http_visit = http_visit if http_visit is not None else get_http_page_visit()
+        self.cfg = cfg
+        self.tiers = tiers if tiers is not None else get_fetch_tiers()
+
+    def is_spa_domain(self, domain: str) -> bool:
+        return any(domain == d or domain.endswith("." + d) for d in self.cfg.spa_domains)
+
+    def fetch_html(self, url: str) -> str:
+        domain = urlparse(url).netloc.lower()
+        use_http = not self.is_spa_domain(domain) and not self.tiers.prefers_browser(domain)
+        http_error = False
+        if use_http:
+            try:
+                html = self.http_visit.fetch_html(url)
+                if not needs_browser(html, self.cfg):
+                    self.tiers.record(domain, "http")
+                    return html
+            except (requests.RequestException, ValueError):
+                http_error = True
+        html = self.browser_visit.fetch_html(url)
+        self.tiers.record(domain, "browser", fallback=use_http, http_error=http_error)
+        return html
+
+    def __call__(self, url: str) -> str:
+        return html_to_markdown(self.fetch_html(url))
+
+
+_http_page_visit: HttpPageVisit | None = None
+_http_page_visit_lock = threading.Lock()
+
+
+def get_http_page_visit() -> HttpPageVisit:
+    # One connection pool for the whole process.
+    global _http_page_visit
+    with _http_page_visit_lock:
+        if _http_page_visit is None:
+            _http_page_visit = HttpPageVisit()
+        return _http_page_visit
 
 
 class InternetSearch:
     def __init__(self,
-                 visit_tool: Callable = PlaywrightPageVisit(),
+                 visit_tool: Callable[[str], str] | None = None,
                  max_results: int = 5,
-                 add_wikipedia_results: bool = False):
+                 add_wikipedia_results: bool = False,
+                 max_concurrency: int = 5,
+                 max_per_domain: int = 2,
+                 page_timeout: float = 20.,
+                 first_k: int | None = None,
+                 search_cache: SearchCache | None = None,
+                 search_tool: Callable[[str], str] | None = None):
         self.add_wikipedia_results = add_wikipedia_results
-        self.search_tool = DuckDuckGoSearchTool(max_results=max_results)
+        self.max_results = max_results
+        self.search_tool = search_tool if search_tool is not None else DuckDuckGoSearchTool(max_results=max_results)
+        if visit_tool is None:
+            visit_tool = CachedPageVisit(TieredPageVisit(browser_visit=PlaywrightPageVisit(timeout=page_timeout)))
         self.visit_tool = visit_tool
-        self.add_wikipedia_results = add_wikipedia_results
-        self.wikipedia_tool = WikipediaRetriever()
-
-    def __call__(self, query: str, **kwargs) -> list[PageResult]:
-        search_results = self.search_tool(query)
-        if self.add_wikipedia_results:
-            search_results += self.search_tool(query+" Wikipedia ")
-        title_links = re.findall(r"\[[^)]+\]\(https://[^)]+\)", search_results)
-        #remove duplicates
-        title_links = list(set(title_links))
-        out = []
-        #added_links = []
-        for result in title_links:
-            link = re.findall(r"\((https://[^)]+)\)", result)[0]
-            try:
-                content = self.visit_tool(link)
-            except Exception as e:
-                continue
-            out.append(PageResult(url=link, source=result, content=content))
-            #added_links.append(link.lower())
+        self.max_concurrency = max_concurrency
+        self.max_per_domain = max_per_domain
+        self.page_timeout = page_timeout
+        self.first_k = first_k
+        self.search_cache = search_cache if search_cache is not None else get_search_cache()
+        self._domain_slots: dict[str, threading.Semaphore] = {}
+        self._domain_slots_lock = threading.Lock()
+
+    @cached_property
+    def wikipedia_tool(self):
+        from langchain_community.retrievers import WikipediaRetriever
+        return WikipediaRetriever()
+
+    def __call__(self, query: str, first_k: int | None = None, **kwargs) -> list[PageResult]:
+        # Repeated and near-duplicate queries reuse the pages found the first time.
+        with span("search"):
+            # The pages kept depend on first_k too, a truncated result must not be served to a wider search.
+            first_k = first_k if first_k is not None else self.first_k
+            namespace = f"{self.max_results}:{self.add_wikipedia_results}:{first_k}"
+            cached = self.search_cache.get(query, namespace=namespace)
+            if cached is not None:
+                record(search_cache_hits=1)
+                return [PageResult(**r) for r in cached]
+            if self.search_cache.cfg.cache_only:
+                raise CacheMissError(f"Query '{query}' is not in the cache and the cache is in cache-only mode.")
+            start = time.perf_counter()
+            out = self.search(query, first_k=first_k)
+            if len(out) > 0:
+                self.search_cache.set(query, [asdict(r) for r in out], cost=time.perf_counter() - start,
+                                      namespace=namespace)
+            return out
+
+    def search(self, query: str, first_k: int | None = None) -> list[PageResult]:
+        with span("search.duckduckgo"):
+            search_results = self.search_tool(query)
+            if self.add_wikipedia_results:
+                search_results += self.search_tool(query+" Wikipedia ")
+        title_links = re.findall(r"\[[^)]+\]\(https?://[^)]+\)", search_results)
+        #remove duplicates, keeping the search ranking
+        title_links = list(dict.fromkeys(title_links))
+        links = [(result, re.findall(r"\((https?://[^)]+)\)", result)[0]) for result in title_links]
+        return self.fetch_pages(links, first_k=first_k if first_k is not None else self.first_k)
 
-        # if self.add_wikipedia_results:
-        #     out.extend(self.wikipedia_results(query, added_links))
-        return out
+    def _domain_slot(self, url: str) -> threading.Semaphore:
+        domain = urlparse(url).netloc.lower()
+        with self._domain_slots_lock:
+            if domain not in self._domain_slots:
+                self._domain_slots[domain] = threading.Semaphore(self.max_per_domain)
+            return self._domain_slots[domain]
+
+    def _visit(self, index: int, url: str, started: dict[int, float]) -> str:
+        with self._domain_slot(url):
+            started[index] = time.monotonic()
+            return self.visit_tool(url)
+
+    def fetch_pages(self, links: list[tuple[str, str]], first_k: int | None = None) -> list[PageResult]:
+        executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        started: dict[int, float] = {}
+        visit = propagate(self._visit)
+        futures = {executor.submit(visit, i, link, started): i for i, (_, link) in enumerate(links)}
+        contents: dict[int, str] = {}
+        pending = set(futures)
+        try:
+            while pending and (first_k is None or len(contents) < first_k):
+                now = time.monotonic()
+                # Pages still waiting for a domain slot haven't started their clock yet.
+                deadlines = [started[futures[f]] + self.page_timeout for f in pending if futures[f] in started]
+                timeout = max(0., min(deadlines) - now) if deadlines else self.page_timeout
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        contents[futures[future]] = future.result()
+                    except Exception:
+                        continue
+                now = time.monotonic()
+                pending = {f for f in pending if futures[f] not in started
+                           or now - started[futures[f]] < self.page_timeout}
+        finally:
+            # Stragglers are abandoned, the visit tool's own timeout eventually frees their threads.
+            executor.shutdown(wait=False, cancel_futures=True)
+        return [PageResult(url=links[i][1], source=links[i][0], content=contents[i]) for i in sorted(contents)]
 
     # def wikipedia_results(self, query: str, added_links: list[str]) -> list[PageResult]:
     #     wikipedia_results = self.wikipedia_tool.invoke(query)
@@ -88,15 +319,61 @@ class VerificationError(Exception):
         super().__init__(self.message)
 
 
-def load_as_txt(filepath: str) -> str:
+def read_table(filepath: str):
+    import pandas as pd
+    ext = os.path.splitext(filepath)[1]
+    if ext == ".csv":
+        return pd.read_csv(filepath)
+    elif ext == ".xlsx":
+        return pd.read_excel(filepath)
+    elif ext == ".parquet":
+        return pd.read_parquet(filepath)
+    elif ext == ".pkl":
+        return pd.read_pickle(filepath)
+    else:
+        raise ValueError(f"File type {ext} not supported")
+
+
+def cache_table(filepath: str, cache_dir: str) -> str:
+    # Spreadsheets are parsed once, the agent code reads the columnar copy.
+    base = os.path.join(cache_dir, file_hash(filepath))
+    for path in [base + ".parquet", base + ".pkl"]:
+        if os.path.exists(path):
+            return path
+    os.makedirs(cache_dir, exist_ok=True)
+    df = read_table(filepath)
+    try:
+        path = base + ".parquet"
+        df.to_parquet(path + ".tmp")
+    except (ImportError, ValueError, TypeError):
+        # No parquet engine installed, or columns of mixed types that parquet can't store.
+        path = base + ".pkl"
+        df.to_pickle(path + ".tmp", compression=None)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def table_as_txt(filepath: str, cfg: TabularCfg = TabularCfg()) -> str:
+    path = cache_table(filepath, os.path.join(get_cache_cfg().cache_dir, "tables"))
+    df = read_table(path)
+    if df.size <= cfg.inline_max_cells:
+        return df.to_string()
+    # The manager prompt is sent again at every step, large tables are described and queried from code instead.
+    reader = "read_parquet" if path.endswith(".parquet") else "read_pickle"
+    dtypes = "\n".join(f"{column}: {dtype}" for column, dtype in df.dtypes.items())
+    return (f"The table has {len(df)} rows and {len(df.columns)} columns, too many to be reported here. "
+            f"Load it in your code with pd.{reader}({os.path.abspath(path)!r}) and query it with pandas.\n"
+            f"Columns and types:\n{dtypes}\n"
+            f"First {cfg.sample_rows} rows:\n{df.head(cfg.sample_rows).to_string()}")
+
+
+def load_as_txt(filepath: str, cfg: TabularCfg = TabularCfg()) -> str:
     ext = os.path.splitext(filepath)[1]
     if ext in [".txt", ".py", ".md", ".json"]:
         with open(filepath, "r") as f:
             out = f.read()
-    elif ext == ".csv":
-        out = pd.read_csv(filepath).to_string()
-    elif ext == ".xlsx":
-        out = pd.read_excel(filepath).to_string()
+    elif ext in [".csv", ".xlsx"]:
+        out = table_as_txt(filepath, cfg=cfg)
     else:
         raise ValueError(f"File type {ext} not supported")
     return out
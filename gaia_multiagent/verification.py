@@ -0,0 +1,49 @@
+import re
+
+from gaia_multiagent.cfg import VerifierCfg
+
+_PREFIX_RE = re.compile(r"^\s*(final answer|answer)\s*[:\-]\s*", re.I)
+# Commas directly followed by three digits are thousands separators and are left alone.
+_LIST_COMMA_RE = re.compile(r"\s*,(?!\d{3}(?!\d))\s*")
+_NUMBER_QUESTION_RE = re.compile(r"\b(how many|what is the number of|what number)\b", re.I)
+_NUMBER_RE = re.compile(r"[-+]?\d+(,\d{3})*(\.\d+)?")
+# Fields of the succinct steps the verifier needs, timings and token counts only make the prompt longer.
+_TRACE_FIELDS = ["plan", "model_output", "observations", "error", "action_output"]
+
+
+def normalize_answer(answer: str) -> str:
+    answer = _PREFIX_RE.sub("", answer.strip())
+    if len(answer) > 1 and answer[0] == answer[-1] and answer[0] in "\"'":
+        answer = answer[1:-1]
+    return _LIST_COMMA_RE.sub(", ", answer).strip()
+
+
+def format_issues(question: str, answer: str) -> list[str]:
+    # Cheap checks of the exact-match format rules given in the task prompt, run before the LLM verifier.
+    issues = []
+    if len(answer) == 0:
+        issues.append("the answer is empty")
+    if "\n" in answer:
+        issues.append("the answer spans several lines, it should only contain what is requested")
+    if re.search(r"[.!?;:]$", answer) is not None and re.search(r"\b[A-Z]\.$", answer) is None:
+        issues.append("the answer must not end with punctuation")
+    if _NUMBER_QUESTION_RE.search(question) is not None and "," not in answer and _NUMBER_RE.fullmatch(answer) is None:
+        issues.append("the question asks for a number, the answer should only be the number in digits, without units")
+    return issues
+
+
+def trim(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    half = max_chars // 2
+    return f"{text[:half]}\n[... {len(text) - 2 * half} characters trimmed ...]\n{text[-half:]}"
+
+
+def compact_trace(steps: list[dict], cfg: VerifierCfg = VerifierCfg()) -> str:
+    lines = []
+    for i, step in enumerate(steps):
+        fields = [f"{k}: {trim(str(step[k]), cfg.max_field_chars)}" for k in _TRACE_FIELDS
+                  if step.get(k) not in [None, "", []]]
+        if len(fields) > 0:
+            lines.append(f"Step {i}\n" + "\n".join(fields))
+    return "\n\n".join(lines)
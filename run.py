@@ -1,37 +1,329 @@
+import multiprocessing
 import os
-from argparse import ArgumentParser
+import threading
+import time
+from argparse import ArgumentParser, ArgumentTypeError
+from multiprocessing.connection import Connection, wait as wait_connections
+from multiprocessing.util import Finalize
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable
 
-import pandas as pd
-
-from gaia_multiagent.api_interaction import fetch_tasks
+from gaia_multiagent.api_interaction import Task, TaskType, fetch_tasks
+from gaia_multiagent.browser import close_browser_pool
+from gaia_multiagent.cache import (CacheMode, configure_caches, get_page_cache, get_response_cache, get_search_cache,
+                                   get_verdict_cache)
+from gaia_multiagent.cfg import CacheCfg, CompactionCfg, HedgeCfg, RunnerCfg, TracingCfg
+from gaia_multiagent.compaction import configure_compaction
+from gaia_multiagent.embeddings import embedding_stats, start_embedding_server
+from gaia_multiagent.engines import cleanup_uploads, get_file_registry
+from gaia_multiagent.hedging import configure_hedging, get_hedger
 from gaia_multiagent.pipeline import multiagent_pipeline
+from gaia_multiagent.rate_limit import rate_limit_stats, set_rate_limit
+from gaia_multiagent.results import TaskCheckpoint, get_result_store
+from gaia_multiagent.tracing import configure_tracing, export_trace, get_tracing_cfg, hot_spots, span
+from gaia_multiagent.utils import get_fetch_tiers
+
+ENGINE_MODEL_ID = "gemini-2.0-flash"
+VERIFIER_MODEL_ID = "gemini-2.5-flash-preview-04-17"
+
+
+def solve_task(task: Task, results_path: str, timeout: float | None = None, **pipeline_kwargs) -> tuple[str, list]:
+    print("Solving task: ", task.description)
+    root = None
+    try:
+        with span("task", task_id=task.task_id, file_type=str(task.file_type)) as root:
+            ans, succint_steps = multiagent_pipeline(task=task,
+                                                     engine_model_id=ENGINE_MODEL_ID,
+                                                     verifier_model_id=VERIFIER_MODEL_ID,
+                                                     timeout=timeout,
+                                                     checkpoint=TaskCheckpoint(get_result_store(results_path),
+                                                                               task.task_id),
+                                                     **pipeline_kwargs)
+    finally:
+        if root is not None:
+            export_trace(root, os.path.join(get_tracing_cfg().trace_dir, f"{task.task_id}.json"))
+    return ans, succint_steps
+
+
+def init_worker(cfg: RunnerCfg, share: int = 1, worker_process: bool = False) -> None:
+    # Each worker process gets its slice of the quota since the budgets live in process memory.
+    for model_id in cfg.requests_per_minute.keys() | cfg.tokens_per_minute.keys():
+        rpm = cfg.requests_per_minute.get(model_id, None)
+        tpm = cfg.tokens_per_minute.get(model_id, None)
+        set_rate_limit(model_id,
+                       requests_per_minute=None if rpm is None else max(1, rpm // share),
+                       tokens_per_minute=None if tpm is None else max(1, tpm // share))
+    configure_caches(cfg.cache_cfg)
+    configure_tracing(cfg.tracing_cfg)
+    configure_hedging(cfg.hedge_cfg)
+    configure_compaction(cfg.compaction_cfg)
+    if worker_process:
+        # Worker processes skip atexit, multiprocessing finalizers still run when the pool shuts them down.
+        Finalize(None, close_browser_pool, exitpriority=10)
+        Finalize(None, cleanup_uploads, exitpriority=10)
+
+
+def run_in_process(conn: Connection, cfg: RunnerCfg, fn: Callable, args: tuple, kwargs: dict) -> None:
+    init_worker(cfg, cfg.workers, True)
+    try:
+        result = (True, fn(*args, **kwargs))
+    except Exception as e:
+        result = (False, e)
+    try:
+        conn.send(result)
+    except Exception as e:
+        # The exception of the task may not be picklable.
+        conn.send((False, RuntimeError(repr(result[1]) if not result[0] else f"Unpicklable result: {e}")))
+    finally:
+        conn.close()
+
+
+class TaskProcessExecutor(Executor):
+    # Runs each task in its own process, at most max_workers at a time, so that a hung task can be terminated without
+    # taking the other tasks down with it.
+    def __init__(self, cfg: RunnerCfg):
+        self.cfg = cfg
+        self._queue: list[tuple[Future, tuple]] = []
+        self._running: dict[Connection, tuple[Future, multiprocessing.Process]] = {}
+        self._terminated: set[Future] = set()
+        self._shutdown = False
+        self._lock = threading.Lock()
+        self._wakeup_reader, self._wakeup_writer = multiprocessing.Pipe(duplex=False)
+        self._thread = threading.Thread(target=self._manage, daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            self._queue.append((future, (fn, args, kwargs)))
+        self._wakeup_writer.send(None)
+        return future
 
+    def terminate(self, future: Future) -> None:
+        with self._lock:
+            for f, process in self._running.values():
+                if f is future:
+                    self._terminated.add(future)
+                    process.terminate()
 
-def run_all(save_csv_path:str)->None:
-    tasks = fetch_tasks()
-    if os.path.exists(save_csv_path):
-        df = pd.read_csv(save_csv_path)
-        new = False
+    def _start_queued(self) -> None:
+        with self._lock:
+            while self._queue and len(self._running) < self.cfg.workers:
+                future, (fn, args, kwargs) = self._queue.pop(0)
+                if not future.set_running_or_notify_cancel():
+                    continue
+                reader, writer = multiprocessing.Pipe(duplex=False)
+                process = multiprocessing.Process(target=run_in_process, args=(writer, self.cfg, fn, args, kwargs))
+                process.start()
+                writer.close()
+                self._running[reader] = (future, process)
+
+    def _collect(self, conn: Connection) -> None:
+        try:
+            ok, value = conn.recv()
+        except EOFError:
+            ok, value = False, None
+        conn.close()
+        with self._lock:
+            future, process = self._running.pop(conn)
+            terminated = future in self._terminated
+            self._terminated.discard(future)
+        process.join()
+        if terminated:
+            future.set_exception(TimeoutError("terminated after the task deadline"))
+        elif value is None and not ok:
+            future.set_exception(RuntimeError(f"worker process exited with code {process.exitcode}"))
+        elif ok:
+            future.set_result(value)
+        else:
+            future.set_exception(value)
+
+    def _manage(self) -> None:
+        while True:
+            self._start_queued()
+            with self._lock:
+                if self._shutdown and not self._queue and not self._running:
+                    return
+                connections = list(self._running)
+            for conn in wait_connections(connections + [self._wakeup_reader]):
+                if conn is self._wakeup_reader:
+                    conn.recv()
+                else:
+                    self._collect(conn)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                for future, _ in self._queue:
+                    future.cancel()
+                self._queue.clear()
+        self._wakeup_writer.send(None)
+        if wait:
+            self._thread.join()
+
+
+def make_executor(cfg: RunnerCfg) -> Executor:
+    if cfg.executor == "thread":
+        init_worker(cfg)
+        return ThreadPoolExecutor(max_workers=cfg.workers)
+    elif cfg.executor == "process":
+        return TaskProcessExecutor(cfg)
     else:
-        df = None
-        new = True
-    for t in tasks:
-        if (df is not None) and (t.task_id in df["task_id"].tolist()):
-            continue
-        print("Solving task: ", t.description)
-        ans, succint_steps = multiagent_pipeline(task=t,
-                                                 engine_model_id="gemini-2.0-flash",
-                                                 verifier_model_id="gemini-2.5-flash-preview-04-17")
-        if isinstance(ans, str):
-            ans = ans.replace(", ", ",").replace(",", ", ") #Sanitize commas
-        print("Final answer: ", ans)
-        save_df = pd.DataFrame([{"task_id":t.task_id, "submitted_answer":ans, "steps":succint_steps}])
-        save_df.to_csv(save_csv_path, mode="a", header=new, index=False)
-        new = False
+        raise ValueError(f"Unknown executor {cfg.executor}")
+
+
+def model_budget(item: str) -> tuple[str, int]:
+    model_id, sep, rpm = item.rpartition("=")
+    if sep == "" or model_id == "":
+        raise ArgumentTypeError(f"expected <model_id>=<requests per minute>, got {item!r}")
+    try:
+        budget = int(rpm)
+    except ValueError:
+        raise ArgumentTypeError(f"requests per minute must be an integer, got {rpm!r}")
+    if budget < 1:
+        raise ArgumentTypeError(f"requests per minute must be at least 1, got {budget}")
+    return model_id, budget
+
+
+def run_all(results_path: str,
+            cfg: RunnerCfg = RunnerCfg(),
+            tasks: list[Task] | None = None,
+            solver: Callable[..., tuple[str, list]] = solve_task) -> None:
+    tasks = fetch_tasks() if tasks is None else tasks
+    store = get_result_store(results_path)
+    tasks = [t for t in tasks if not store.is_solved(t.task_id)]
+    if cfg.embedding_server_port is not None:
+        # Started before the workers so that they inherit its address and share one copy of the model.
+        start_embedding_server(("127.0.0.1", cfg.embedding_server_port))
+    executor = make_executor(cfg)
+    if cfg.executor == "thread" and cfg.cache_cfg.response_mode != CacheMode.REPLAY:
+        for t in tasks:
+            if t.file_type in [TaskType.IMAGE, TaskType.AUDIO, TaskType.VIDEO]:
+                get_file_registry().upload(t.filepath)
+    futures: dict[Future, Task] = {executor.submit(solver, t, results_path, cfg.task_timeout): t for t in tasks}
+    started: dict[Future, float] = {}
+    timed_out: list[Future] = []
+    pending = set(futures)
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=1., return_when=FIRST_COMPLETED)
+            for future in done:
+                t = futures[future]
+                try:
+                    ans, succint_steps = future.result()
+                except Exception as e:
+                    print(f"Task {t.task_id} failed: {e}")
+                    continue
+                print("Final answer: ", ans)
+                store.add(t.task_id, ans, succint_steps)
+            if cfg.task_timeout is None:
+                continue
+            now = time.monotonic()
+            for future in list(pending):
+                if future.running():
+                    started.setdefault(future, now)
+                    # The pipeline interrupts itself at the timeout, the grace period covers the step in flight.
+                    if now - started[future] > 2 * cfg.task_timeout and future not in timed_out:
+                        timed_out.append(future)
+                        if isinstance(executor, TaskProcessExecutor):
+                            print(f"Task {futures[future].task_id} timed out, terminating its process.")
+                            executor.terminate(future)
+                        else:
+                            # Threads can't be killed: the interrupt is soft and the task keeps its worker until it
+                            # reaches its next step, the queued tasks wait for a free worker in the meantime.
+                            print(f"Task {futures[future].task_id} timed out, no longer waiting for it but it holds "
+                                  f"its worker until its step in flight ends.")
+                            pending.discard(future)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        if cfg.executor == "thread":
+            # The timed-out tasks still use the shared browser pool and uploads, they get one more timeout to reach
+            # their next step and stop.
+            wait(timed_out, timeout=cfg.task_timeout)
+        alive = [futures[f].task_id for f in timed_out if not f.done()]
+        if cfg.executor == "thread" and len(alive) > 0:
+            print(f"Tasks {alive} are still running, the browser pool and the uploads are left open.")
+        else:
+            close_browser_pool()
+            cleanup_uploads()
+        if cfg.executor == "thread":
+            print("Page cache: ", get_page_cache().stats())
+            print("Search cache: ", get_search_cache().stats())
+            print("LLM response cache: ", get_response_cache().stats())
+            print("Verdict cache: ", get_verdict_cache().stats())
+            print("Gemini rate limits: ", rate_limit_stats())
+            print("Page fetch tiers: ", get_fetch_tiers().stats())
+            print("Hedged requests: ", get_hedger().stats())
+        if cfg.executor == "thread" or cfg.embedding_server_port is not None:
+            print("Embeddings: ", embedding_stats())
+        print("Hot spots over the tasks of this run:")
+        for name, total in hot_spots(cfg.tracing_cfg.trace_dir, [t.task_id for t in tasks])[:15]:
+            print(f"    {name}: {total['seconds']:.1f}s over {total['count']} spans in {total['tasks']} tasks",
+                  {k: v for k, v in total.items() if k not in ["seconds", "count", "tasks"]})
+
 
 if __name__ == "__main__":
     parser = ArgumentParser()
-    parser.add_argument("--save_csv_path", type=str, default="submit_answers.csv")
+    parser.add_argument("--results_path", type=str, default="results.sqlite",
+                        help="Answers and per-step checkpoints, solved tasks are skipped and crashed ones resumed.")
+    parser.add_argument("--save_csv_path", type=str, default="submit_answers.csv",
+                        help="Answers of earlier runs in the old CSV format, imported once into --results_path.")
+    parser.add_argument("--export_csv_path", type=str, default=None,
+                        help="Only export the stored answers to this submission CSV and exit.")
+    parser.add_argument("--workers", type=int, default=RunnerCfg.workers)
+    parser.add_argument("--executor", type=str, choices=["thread", "process"], default=RunnerCfg.executor)
+    parser.add_argument("--task_timeout", type=float, default=RunnerCfg.task_timeout,
+                        help="Seconds after which a task is interrupted, past twice this time its process is "
+                             "terminated with --executor process. Threads are only interrupted between steps.")
+    parser.add_argument("--rpm", type=model_budget, nargs="*", default=[],
+                        help="Per-model request budget shared by all workers, e.g. gemini-2.0-flash=15.")
+    parser.add_argument("--embedding_server_port", type=int, default=RunnerCfg.embedding_server_port,
+                        help="Serve the embedding models from one process on this port, shared by all the workers.")
+    parser.add_argument("--cache_dir", type=str, default=CacheCfg.cache_dir)
+    parser.add_argument("--cache_only", action="store_true",
+                        help="Serve searches and web pages only from the cache, to replay a run offline.")
+    parser.add_argument("--llm_cache", type=str, choices=[m.value for m in CacheMode], default=CacheCfg.response_mode,
+                        help="Record Gemini responses to disk, replay them without any API call, or bypass the cache.")
+    parser.add_argument("--trace_dir", type=str, default=TracingCfg.trace_dir,
+                        help="Where the trace of each task is written, with per-stage time, tokens and cache hits.")
+    parser.add_argument("--otel", action="store_true",
+                        help="Also emit the spans to the configured OpenTelemetry tracer provider.")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Duplicate the Gemini calls and page fetches that run past a percentile of their recent "
+                             "latencies, the first response wins.")
+    parser.add_argument("--hedge_percentile", type=float, default=HedgeCfg.percentile)
+    parser.add_argument("--hedge_max_extra", type=float, default=HedgeCfg.max_extra_fraction,
+                        help="Cap on the duplicated requests, as a fraction of the calls of each endpoint.")
+    parser.add_argument("--history_budget", type=int, default=None,
+                        help="Compact the older observations of an agent once its prompt exceeds this many tokens.")
     args = parser.parse_args()
-    run_all(save_csv_path=args.save_csv_path)
-
+    if os.path.exists(args.save_csv_path):
+        n = get_result_store(args.results_path).import_csv(args.save_csv_path)
+        if n > 0:
+            print(f"Imported {n} answers from {args.save_csv_path}")
+    if args.export_csv_path is not None:
+        n = get_result_store(args.results_path).export_csv(args.export_csv_path)
+        print(f"Exported {n} answers to {args.export_csv_path}")
+        raise SystemExit(0)
+    requests_per_minute = RunnerCfg().requests_per_minute
+    requests_per_minute.update(args.rpm)
+    compaction_cfg = CompactionCfg()
+    if args.history_budget is not None:
+        compaction_cfg = CompactionCfg(enabled=True, token_budget=args.history_budget)
+    run_all(results_path=args.results_path, cfg=RunnerCfg(workers=args.workers,
+                                                          executor=args.executor,
+                                                          task_timeout=args.task_timeout,
+                                                          requests_per_minute=requests_per_minute,
+                                                          cache_cfg=CacheCfg(cache_dir=args.cache_dir,
+                                                                             cache_only=args.cache_only,
+                                                                             response_mode=args.llm_cache),
+                                                          embedding_server_port=args.embedding_server_port,
+                                                          tracing_cfg=TracingCfg(trace_dir=args.trace_dir,
+                                                                                 otel=args.otel),
+                                                          hedge_cfg=HedgeCfg(enabled=args.hedge,
+                                                                             percentile=args.hedge_percentile,
+                                                                             max_extra_fraction=args.hedge_max_extra),
+                                                          compaction_cfg=compaction_cfg))
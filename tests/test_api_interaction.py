@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+from benchmarks.fakes import FakeScoringAPI
+from gaia_multiagent.api_interaction import download_file, make_session
+
+CONTENT = bytes(range(256)) * 64
+
+
+@pytest.fixture
+def api():
+    with FakeScoringAPI(questions=[], files={"t1": CONTENT}) as api:
+        yield api
+
+
+def download(api: FakeScoringAPI, filepath: str) -> dict:
+    return download_file(make_session(retries=0), f"{api.url}/files/t1", str(filepath), timeout=5., chunk_size=1024)
+
+
+def test_download(api, tmp_path):
+    entry = download(api, tmp_path / "f.bin")
+    assert (tmp_path / "f.bin").read_bytes() == CONTENT and entry["size"] == len(CONTENT)
+    assert not os.path.exists(tmp_path / "f.bin.part")
+
+
+def test_resume(api, tmp_path):
+    (tmp_path / "f.bin.part").write_bytes(CONTENT[:1000])
+    download(api, tmp_path / "f.bin")
+    assert (tmp_path / "f.bin").read_bytes() == CONTENT
+    assert api.requests[-1][1:] == (206, len(CONTENT) - 1000)
+
+
+def test_complete_partial_is_promoted(api, tmp_path):
+    (tmp_path / "f.bin.part").write_bytes(CONTENT)
+    download(api, tmp_path / "f.bin")
+    assert (tmp_path / "f.bin").read_bytes() == CONTENT
+    assert [status for _, status, _ in api.requests] == [416]
+
+
+def test_oversized_partial_is_downloaded_again(api, tmp_path):
+    (tmp_path / "f.bin.part").write_bytes(CONTENT + b"garbage")
+    download(api, tmp_path / "f.bin")
+    assert (tmp_path / "f.bin").read_bytes() == CONTENT
+    assert [status for _, status, _ in api.requests] == [416, 200]
@@ -0,0 +1,31 @@
+from gaia_multiagent.cache import CacheMode, SearchCache, VerdictCache
+from gaia_multiagent.cfg import CacheCfg
+
+RESULTS = [{"url": "https://example.com", "source": "web", "content": "text"}]
+
+
+def test_search_namespaces_survive_reload(tmp_path):
+    cfg = CacheCfg(cache_dir=str(tmp_path))
+    SearchCache(cfg).set("studio albums of Mercedes Sosa", RESULTS, namespace="5:True:3")
+    cache = SearchCache(cfg)
+    assert cache.get("Mercedes Sosa studio albums", namespace="5:True:3") == RESULTS
+    assert cache.get("Mercedes Sosa studio albums", namespace="5:True:None") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_verdicts_stay_in_memory_without_recording(tmp_path):
+    cfg = CacheCfg(cache_dir=str(tmp_path), response_mode=CacheMode.PASSTHROUGH)
+    cache = VerdictCache(cfg)
+    key = cache.key(model_id="m", task="t", answer="a", instruction="i", thinking_budget=1)
+    cache.set(key, "[CORRECT]")
+    assert cache.get(key) == "[CORRECT]"
+    assert VerdictCache(cfg).get(key) is None
+    assert not (tmp_path / "verdicts.sqlite").exists()
+
+
+def test_recorded_verdicts_are_persisted(tmp_path):
+    cfg = CacheCfg(cache_dir=str(tmp_path), response_mode=CacheMode.RECORD)
+    key = VerdictCache.key(model_id="m", task="t", answer="a", instruction="i", thinking_budget=1)
+    VerdictCache(cfg).set(key, "[WRONG]")
+    assert VerdictCache(cfg).get(key) == "[WRONG]"
+    assert key != VerdictCache.key(model_id="m", task="t", answer="a", instruction="j", thinking_budget=1)
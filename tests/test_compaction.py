@@ -0,0 +1,39 @@
+from gaia_multiagent.cfg import CompactionCfg
+from gaia_multiagent.compaction import HistoryCompactor, ObservationStore
+
+
+def content(role: str, text: str) -> dict:
+    return {"role": role, "parts": [{"text": text}]}
+
+
+def history(steps: int) -> list[dict]:
+    # The task, then per step the model output, the tool call and the observation.
+    contents = [content("user", "task " * 500)]
+    for step in range(steps):
+        contents += [content("model", f"code {step}"), content("model", f"call {step}"),
+                     content("user", f"observation {step} " + "x" * 2000)]
+    return contents
+
+
+def test_recent_steps_are_kept():
+    compactor = HistoryCompactor(CompactionCfg(enabled=True, token_budget=100, keep_recent_steps=2), ObservationStore())
+    compacted = compactor.compact("system", history(5))
+    texts = [c["parts"][0]["text"] for c in compacted]
+    assert texts[0] == "task " * 500
+    assert all("compacted from" in texts[3 * step + 3] for step in range(3))
+    assert all("compacted from" not in texts[3 * step + 3] for step in range(3, 5))
+    assert [c["role"] for c in compacted] == [c["role"] for c in history(5)]
+
+
+def test_compacted_observation_can_be_recalled():
+    store = ObservationStore()
+    compactor = HistoryCompactor(CompactionCfg(enabled=True, token_budget=100, keep_recent_steps=1), store)
+    compacted = compactor.compact("system", history(2))
+    text = compacted[3]["parts"][0]["text"]
+    key = text[text.index("observation obs-") + len("observation "):].split(" ")[0]
+    assert store.get(key) == history(2)[3]["parts"][0]["text"]
+
+
+def test_under_budget_is_untouched():
+    contents = history(2)
+    assert HistoryCompactor(CompactionCfg(enabled=True), ObservationStore()).compact("system", contents) is contents
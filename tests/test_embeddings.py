@@ -0,0 +1,60 @@
+import threading
+
+import numpy as np
+
+from benchmarks.fakes import HashingEmbeddings
+from gaia_multiagent.cfg import CacheCfg
+from gaia_multiagent.embeddings import (EMBEDDING_SERVER_AUTHKEY, EMBEDDING_SERVER_ENV, EmbeddingCache,
+                                        EmbeddingManager, EmbeddingService, embedding_stats, set_embedding_service,
+                                        text_hash)
+
+
+def vector(text: str) -> np.ndarray:
+    return np.random.default_rng(int(text_hash(text)[:8], 16)).random(8, dtype=np.float32)
+
+
+def test_put_get_and_reuse_rows(tmp_path):
+    cache = EmbeddingCache("model", CacheCfg(cache_dir=str(tmp_path), embedding_capacity=4))
+    texts = [f"text {i}" for i in range(6)]
+    cache.put([text_hash(t) for t in texts[:3]], np.stack([vector(t) for t in texts[:3]]))
+    cache.put([text_hash(t) for t in texts[3:]], np.stack([vector(t) for t in texts[3:]]))
+    found = cache.get([text_hash(t) for t in texts])
+    # The two oldest rows were reused by the second batch.
+    assert sorted(found) == sorted(text_hash(t) for t in texts[2:])
+    for t in texts[2:]:
+        np.testing.assert_array_equal(found[text_hash(t)], vector(t))
+    assert cache.stats()["hits"] == 4 and cache.stats()["misses"] == 2
+
+
+def test_concurrent_readers_see_consistent_rows(tmp_path):
+    cfg = CacheCfg(cache_dir=str(tmp_path), embedding_capacity=16)
+    errors = []
+
+    def writer(worker: int) -> None:
+        cache = EmbeddingCache("model", cfg)
+        for i in range(50):
+            texts = [f"{worker} {i} {j}" for j in range(3)]
+            cache.put([text_hash(t) for t in texts], np.stack([vector(t) for t in texts]))
+            for t in texts + [f"{1 - worker} {i} 0"]:
+                for h, v in cache.get([text_hash(t)]).items():
+                    if not np.array_equal(v, vector(t)):
+                        errors.append(t)
+
+    threads = [threading.Thread(target=writer, args=(w,)) for w in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+
+
+def test_stats_of_loaded_services_locally_and_from_the_server(monkeypatch):
+    service = EmbeddingService("stats-model", model=HashingEmbeddings(dim=8))
+    set_embedding_service(service)
+    service.embed_documents(["a", "b", "c"])
+    local = embedding_stats()["stats-model"]
+    assert local["chunks"] == 3 and local["batches"] == 1 and local["mean_batch_size"] == 3.
+    server = EmbeddingManager(address=("127.0.0.1", 0), authkey=EMBEDDING_SERVER_AUTHKEY).get_server()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv(EMBEDDING_SERVER_ENV, f"{server.address[0]}:{server.address[1]}")
+    assert embedding_stats()["stats-model"] == local
@@ -0,0 +1,30 @@
+import os
+
+import pytest
+
+from gaia_multiagent.cfg import ExtractCfg
+from gaia_multiagent.extraction import html_to_markdown
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "fixtures", "html")
+
+
+def fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES, name)) as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("cfg", [ExtractCfg(), ExtractCfg(fast_path_chars=0)])
+def test_every_article_of_a_thread_is_kept(cfg):
+    markdown = html_to_markdown(fixture("forum_thread.html"), cfg=cfg)
+    for text in ["I always assumed it was the one at Millford", "recorded in a manor survey of 1394",
+                 "walk up to Hollins Beck this weekend", "4 May 2023"]:
+        assert text in markdown
+    for chrome in ["Similar topics", "Log in", "Privacy"]:
+        assert chrome not in markdown
+
+
+def test_single_article_is_the_root():
+    markdown = html_to_markdown(fixture("news_article.html"))
+    assert "Scientists map the deepest trench in unprecedented detail" in markdown
+    for chrome in ["Your privacy", "Get the newsletter", "Related"]:
+        assert chrome not in markdown
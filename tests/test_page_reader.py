@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+
+from benchmarks.fakes import HashingEmbeddings
+from gaia_multiagent.cfg import PageReaderCfg
+from gaia_multiagent.tools.search import WebPageRetriever
+
+
+class VerboseEngine:
+    # Every map call returns an extract as long as the whole page budget.
+    def __init__(self, extract_chars: int):
+        self.extract_chars = extract_chars
+        self.prompts: list[str] = []
+
+    def __call__(self, messages: list[dict]) -> SimpleNamespace:
+        prompt = messages[-1]["content"][0]["text"]
+        self.prompts.append(prompt)
+        return SimpleNamespace(content="x" * self.extract_chars)
+
+
+def test_reduce_prompt_fits_the_page_budget():
+    cfg = PageReaderCfg(max_page_tokens=1_000, map_reduce_tokens=2_000, max_map_sections=4, chunk_size=500,
+                        chunk_overlap=0)
+    engine = VerboseEngine(extract_chars=cfg.max_page_tokens * cfg.chars_per_token)
+    page = "\n\n".join(f"Paragraph {i} of a very long page. " * 10 for i in range(100))
+    reader = WebPageRetriever(engine=engine, visit_tool=lambda url: page, embeddings=HashingEmbeddings(), cfg=cfg)
+    reader.forward(task="paragraph 42", url="https://example.com")
+    assert reader.timings[-1]["mode"] == "map_reduce"
+    reduce_prompt = engine.prompts[-1]
+    assert reduce_prompt.count("<extract>") == cfg.max_map_sections
+    context = reduce_prompt[:reduce_prompt.rindex("</extract>\n") + len("</extract>\n")]
+    assert reader.tokens(context) <= cfg.max_page_tokens
+
+
+def test_short_extracts_are_kept_whole():
+    reader = WebPageRetriever(engine=VerboseEngine(0), visit_tool=lambda url: "", embeddings=HashingEmbeddings(),
+                              cfg=PageReaderCfg(max_page_tokens=100))
+    extracts = ["short", "y" * 1_000]
+    fitted = reader.fit_extracts(extracts)
+    assert fitted[0] == "short"
+    assert fitted[1].endswith("[...]")
+    assert sum(len(f"<extract>{e}</extract>\n") for e in fitted) <= 100 * reader.cfg.chars_per_token
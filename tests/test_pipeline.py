@@ -0,0 +1,28 @@
+from smolagents import CodeAgent
+
+from gaia_multiagent.engines import GeminiEngine, GeminiVerifier
+from gaia_multiagent.pipeline import answer_check
+
+
+class AnsweringEngine(GeminiEngine):
+    # Answers with the country first, and with the city alone once the check has rejected it.
+    def _generate(self, system: str, contents: list[dict], stop_sequences: list[str]) -> str:
+        conversation = "\n".join(c["parts"][0]["text"] for c in contents)
+        answer = "Paris" if "verify_answer failed" in conversation else "France"
+        return f"Thought: I know it.\n```py\nfinal_answer({answer!r})\n```<end_code>"
+
+
+class CityVerifier(GeminiVerifier):
+    def _generate(self, prompt: str) -> str:
+        return "[CORRECT]" if "AI agent answer: Paris" in prompt else "[WRONG] The question asks for a city."
+
+
+def test_rejected_answer_is_retried():
+    question = "What is the capital of France?"
+    agent = CodeAgent(model=AnsweringEngine(model_id="scripted"),
+                      tools=[],
+                      final_answer_checks=[answer_check(CityVerifier(model_id="scripted-verifier"), question)],
+                      max_steps=3)
+    assert agent.run(question) == "Paris"
+    errors = [str(s.error) for s in agent.memory.steps if getattr(s, "error", None) is not None]
+    assert len(errors) == 1 and "The question asks for a city." in errors[0]
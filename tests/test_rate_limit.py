@@ -0,0 +1,32 @@
+import httpx
+import pytest
+import requests
+from google.genai import errors
+
+from gaia_multiagent.rate_limit import is_transient
+
+
+@pytest.mark.parametrize("error", [errors.ClientError(429, {"error": {"status": "RESOURCE_EXHAUSTED"}}),
+                                   errors.ServerError(500, {}),
+                                   errors.ServerError(503, {}),
+                                   requests.ConnectionError("reset"),
+                                   requests.Timeout("read timed out"),
+                                   httpx.ConnectTimeout("connect timed out"),
+                                   httpx.ConnectError("refused"),
+                                   httpx.RemoteProtocolError("disconnected"),
+                                   TimeoutError(),
+                                   ConnectionResetError()])
+def test_transient(error):
+    assert is_transient(error)
+
+
+@pytest.mark.parametrize("error", [errors.ClientError(400, {"error": {"status": "INVALID_ARGUMENT"}}),
+                                   errors.ClientError(403, {}),
+                                   errors.ClientError(404, {}),
+                                   ValueError("bad response"),
+                                   KeyError("candidates"),
+                                   TypeError(),
+                                   httpx.UnsupportedProtocol("ftp"),
+                                   requests.HTTPError("404 Client Error")])
+def test_not_transient(error):
+    assert not is_transient(error)
@@ -0,0 +1,10 @@
+from benchmarks.fakes import HashingEmbeddings
+from gaia_multiagent.retrieval import TaskVectorIndex
+from gaia_multiagent.tools.search import WebResultsRAG
+
+
+def test_search_without_pages_returns_empty_observation():
+    index = TaskVectorIndex(HashingEmbeddings())
+    rag = WebResultsRAG(websearch_engine=lambda query: [], index=index)
+    assert rag.forward("a query without any page") == ""
+    assert index.query_timings[-1]["query_seconds"] == 0.
@@ -0,0 +1,19 @@
+from argparse import ArgumentTypeError
+
+import pytest
+
+from run import model_budget
+
+
+@pytest.mark.parametrize("item, expected", [("gemini-2.0-flash=15", ("gemini-2.0-flash", 15)),
+                                            ("models/a=b=3", ("models/a=b", 3)),
+                                            ("gemini-2.5-flash-preview-04-17=1", ("gemini-2.5-flash-preview-04-17", 1))])
+def test_model_budget(item, expected):
+    assert model_budget(item) == expected
+
+
+@pytest.mark.parametrize("item", ["gemini-2.0-flash", "=15", "a=b=c", "gemini-2.0-flash=1.5", "gemini-2.0-flash=",
+                                  "gemini-2.0-flash=0", "gemini-2.0-flash=-5"])
+def test_invalid_model_budget(item):
+    with pytest.raises(ArgumentTypeError):
+        model_budget(item)
@@ -0,0 +1,28 @@
+import pytest
+
+from gaia_multiagent.utils import decode_html
+
+PAGE = "<html><head>{meta}</head><body>Società Ñandú – 東京</body></html>"
+
+
+@pytest.mark.parametrize("content_type, meta, encoding", [("text/html; charset=utf-8", "", "utf-8"),
+                                                          ("text/html", "<meta charset=\"utf-8\">", "utf-8"),
+                                                          ("text/html", "<meta http-equiv=\"Content-Type\" "
+                                                                        "content=\"text/html; charset=UTF-8\">", "utf-8"),
+                                                          ("text/html", "", "utf-8"),
+                                                          ("text/html; charset=shift_jis", "", "shift_jis")])
+def test_declared_or_detected_charset(content_type, meta, encoding):
+    html = PAGE.format(meta=meta)
+    content = html.encode(encoding, errors="ignore")
+    assert decode_html(content, content_type, fallback=lambda: "utf-8") == content.decode(encoding)
+
+
+def test_latin1_page():
+    html = PAGE.format(meta="<meta charset='iso-8859-1'>").replace(" – 東京", "")
+    assert decode_html(html.encode("latin-1"), "text/html") == html
+
+
+def test_wrong_declaration_falls_back():
+    html = PAGE.format(meta="")
+    assert decode_html(html.encode("utf-8"), "text/html; charset=ascii", fallback=lambda: "utf-8") == html
+    assert decode_html(html.encode("utf-8"), "text/html; charset=unknown-charset") == html
@@ -0,0 +1,41 @@
+import pytest
+
+from gaia_multiagent.verification import format_issues, normalize_answer
+
+
+@pytest.mark.parametrize("answer, expected", [("1,234", "1,234"),
+                                              ("12,345,678", "12,345,678"),
+                                              ("apple,banana , cherry", "apple, banana, cherry"),
+                                              ("1,2,3", "1, 2, 3"),
+                                              ("1, 234", "1, 234"),
+                                              ("\"Paris\"", "Paris"),
+                                              ("'Paris'", "Paris"),
+                                              ("\"", "\""),
+                                              ("Final answer: 42", "42"),
+                                              ("answer - b, e", "b, e"),
+                                              ("  FINAL ANSWER:  Rome ", "Rome"),
+                                              ("The answer is 5", "The answer is 5")])
+def test_normalize_answer(answer, expected):
+    assert normalize_answer(answer) == expected
+
+
+@pytest.mark.parametrize("question, answer", [("How many studio albums were published?", "3"),
+                                              ("How many residents were there in 2020?", "1,234,567"),
+                                              ("What is the number of moons?", "-2.5"),
+                                              ("Who wrote the book?", "J. R. R. Tolkien"),
+                                              ("Who nominated the article?", "FunkMonk"),
+                                              ("List the vegetables.", "broccoli, celery, lettuce"),
+                                              ("What is the initial of the surname?", "T.")])
+def test_format_accepted(question, answer):
+    assert format_issues(question, answer) == []
+
+
+@pytest.mark.parametrize("question, answer, issue", [("Who wrote the book?", "", "empty"),
+                                                     ("Who wrote the book?", "Tolkien\nHobbit", "several lines"),
+                                                     ("What is the capital?", "Rome.", "punctuation"),
+                                                     ("Which city?", "Rome!", "punctuation"),
+                                                     ("How many albums were published?", "three", "number"),
+                                                     ("How many albums were published?", "3 albums", "number")])
+def test_format_rejected(question, answer, issue):
+    issues = format_issues(question, answer)
+    assert len(issues) == 1 and issue in issues[0]
@@ -0,0 +1,47 @@
+import pytest
+
+from gaia_multiagent.tools.youtube import is_speech_question, parse_video_id
+
+
+@pytest.mark.parametrize("question", ["What does Teal'c say in response to the question \"Isn't that hot?\"",
+                                      "Transcribe what the narrator says at the beginning.",
+                                      "Which word is pronounced twice in the audio?"])
+def test_speech_question(question):
+    assert is_speech_question(question)
+
+
+@pytest.mark.parametrize("question", ["What is the highest number of bird species on camera simultaneously?",
+                                      "What does the sign say at the end of the video?",
+                                      "How many spokes does the wheel have?",
+                                      "What is the heart rate shown on the monitor?",
+                                      "Which soundtrack plays in the intro?",
+                                      "What color is the shirt of the man who says hello?"])
+def test_video_question(question):
+    assert not is_speech_question(question)
+
+
+@pytest.mark.parametrize("url", ["https://www.youtube.com/watch?v=L1vXCYZAYYM",
+                                 "https://www.youtube.com/watch?v=L1vXCYZAYYM&t=42s",
+                                 "https://www.youtube.com/watch?list=PL0123456789&v=L1vXCYZAYYM&index=2",
+                                 "https://m.youtube.com/watch?v=L1vXCYZAYYM&feature=share",
+                                 "https://youtu.be/L1vXCYZAYYM",
+                                 "https://youtu.be/L1vXCYZAYYM?t=42",
+                                 "https://youtu.be/L1vXCYZAYYM?si=abc&t=7",
+                                 "https://www.youtube.com/shorts/L1vXCYZAYYM",
+                                 "https://www.youtube.com/embed/L1vXCYZAYYM?start=10",
+                                 "www.youtube.com/watch?v=L1vXCYZAYYM",
+                                 "youtu.be/L1vXCYZAYYM",
+                                 " https://www.youtube.com/watch?v=L1vXCYZAYYM \n"])
+def test_parse_video_id(url):
+    assert parse_video_id(url) == "L1vXCYZAYYM"
+
+
+@pytest.mark.parametrize("url", ["https://www.youtube.com/",
+                                 "https://www.youtube.com/watch?list=PL0123456789",
+                                 "https://www.youtube.com/watch?v=short",
+                                 "https://vimeo.com/L1vXCYZAYYM",
+                                 "https://youtu.be/",
+                                 "not a url"])
+def test_invalid_video_url(url):
+    with pytest.raises(ValueError):
+        parse_video_id(url)